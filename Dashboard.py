@@ -1,7 +1,13 @@
+import logging
+
 import streamlit as st
-import pandas as pd
-import base64
 
+from roadsafety import perf
+from roadsafety.data import DOCUMENTATION_PDF, documentation_pdf, performance_panel, preview, select_filters, select_years, summary, years_label
+
+
+# Log the background work of the server (data reloads, cache warm-up)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
 
 # Page configuration
 st.set_page_config(
@@ -10,12 +16,12 @@ st.set_page_config(
     layout="wide"
 )
 
-# Load data
-@st.cache_data
-def load_data():
-    return pd.read_csv('./data/df_dataset.csv')
+# Timings of this rerun (see the performance panel)
+perf.begin("Home")
 
-df = load_data()
+# Sidebar selection (shared across all pages); without filters the home page loads no rows
+years = select_years()
+filters = select_filters(years)
 
 
 # Home page
@@ -39,8 +45,16 @@ Use the sidebar menu to explore different sections:
 
 """)
 
+# Summary from the file metadata and the precomputed counts
+stats = summary(years, filters)
+col1, col2, col3, col4 = st.columns(4)
+col1.metric(f"Victims ({years_label(years)})", f"{stats['rows']:,}")
+col2.metric("Columns", stats['columns'])
+col3.metric("Killed", f"{stats['killed']:,}")
+col4.metric("Hospitalized injured", f"{stats['hospitalized']:,}")
+
 st.subheader("Sample of the Dataset")
-st.dataframe(df.head(10))
+st.dataframe(preview(years, 10, filters))
 
 st.info("This dataset contains detailed information about road accidents in France, including factors such as location, time, weather conditions, and victim characteristics." \
 "It is sourced from the official French road safety database. The dataset used is an aggregated annual version.")
@@ -53,12 +67,12 @@ st.markdown("""
 For more information, consult the official PDF describing the database:
 """)
 
-# Download link for PDF
-pdf_path = "./description-des-bases-de-donnees-annuelles.pdf"
-with open(pdf_path, "rb") as pdf_file:
-    pdf_bytes = pdf_file.read()
-    b64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-    href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="description-des-bases-de-donnees-annuelles.pdf">Download PDF Documentation</a>'
-    st.markdown(href, unsafe_allow_html=True)
+# Download button for PDF (bytes read once per server, served as a file, not inlined in the page)
+st.download_button("Download PDF Documentation",
+                   data=documentation_pdf(),
+                   file_name=DOCUMENTATION_PDF.name,
+                   mime="application/pdf")
+
+st.markdown("---")
 
-st.markdown("---")
\ No newline at end of file
+performance_panel()
@@ -1,23 +1,29 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 
+from roadsafety import analysis, perf
+from roadsafety.data import available_columns, cached_figure, daily_counts, kpis, map_data, performance_panel, select_filters, select_years, years_label
+from roadsafety.geo import AREAS, view
+from roadsafety.labels import LABELS
+
 st.set_page_config(page_title="Global Overview", page_icon="📊", layout="wide")
 
-@st.cache_data
-def load_data():
-    return pd.read_csv('./data/df_dataset.csv')
+# Timings of this rerun (see the performance panel)
+perf.begin("Global Overview")
 
-df = load_data()
+years = select_years()
+filters = select_filters(years)
+columns = available_columns()
 
 st.title("Part 1: Global Overview")
 
 # Global statistics with color coding
-# Calculate global statistics
-total_accidents = len(df)
-total_deaths = len(df[df['grav'] == 2])
-total_hospitalized = len(df[df['grav'] == 3])
-total_minor = len(df[df['grav'] == 4])
+# Calculate global statistics (one pass over the severity codes, cached per year selection)
+stats = kpis(years, filters)
+total_accidents = stats['accidents']
+total_deaths = stats['killed']
+total_hospitalized = stats['hospitalized']
+total_minor = stats['minor']
 
 # Display global overview with color coding
 col1, col2, col3, col4 = st.columns(4)
@@ -66,57 +72,55 @@ st.markdown("---")
 
 st.subheader("Annual evolution of fatal and injury accidents")
 
-# Graph of accidents by day over the year 2024
+# Resolution of the time series: pandas frequency and unit name
+PERIODS = {
+    'Day': ('D', 'day'),
+    'Week': ('W', 'week'),
+    'Month': ('MS', 'month'),
+}
+
+# Graph of accidents by day over the selected years
 # According to PDF: 'jour' is day of month (1-31), 'mois' is month (1-12), 'an' is year
 # 'grav' is accident severity
-if 'jour' in df.columns and 'mois' in df.columns and 'grav' in df.columns and 'an' in df.columns:
-    # Filter only 2024 data
-    df_2024 = df[df['an'] == 2024].copy()
-    st.write("Number of rows for 2024:", len(df_2024))
+if 'date' in columns and 'grav' in columns:
+    # Accidents per day (rows) and severity (columns), precomputed in the cube
+    accidents_par_jour = daily_counts(years, filters)
+    st.write(f"Number of rows for {years_label(years)}:", int(accidents_par_jour.to_numpy().sum()))
     
-    if len(df_2024) > 0:
-        # Create complete date column
-        df_2024['date'] = pd.to_datetime(df_2024[['an', 'mois', 'jour']].rename(columns={'an': 'year', 'mois': 'month', 'jour': 'day'}), errors='coerce')
-        
-        # Map severity codes to their labels
-        gravite_labels = {
-            1: 'Unharmed',
-            2: 'Killed',
-            3: 'Hospitalized injured',
-            4: 'Minor injuries'
-        }
-        
-        # Get unique severities
-        gravites_disponibles = sorted(df_2024['grav'].unique())
-        
-        # Multi-select for severities with labels
+    if accidents_par_jour.to_numpy().sum() > 0:
+        # Multi-select for severities (the columns are already labelled)
         gravites_selectionnees = st.multiselect(
             "Select severities to display:",
-            options=gravites_disponibles,
-            default=gravites_disponibles,
-            format_func=lambda x: f"{x} - {gravite_labels.get(x, 'Unknown')}",
+            options=list(accidents_par_jour.columns),
+            default=list(accidents_par_jour.columns),
             help="1=Unharmed, 2=Killed, 3=Hospitalized injured, 4=Minor injuries"
         )
         
+        col_periode, col_moyenne = st.columns(2)
+        with col_periode:
+            periode = st.radio("Resolution:", list(PERIODS), horizontal=True, key="periode_evolution")
+        with col_moyenne:
+            fenetre = st.slider(f"Rolling average ({PERIODS[periode][1]}s, 1 = off):", 1, 30, 1,
+                                key="moyenne_evolution")
+        
         if gravites_selectionnees:
-            # Filter according to selected severities
-            df_filtre = df_2024[df_2024['grav'].isin(gravites_selectionnees)]
-            
-            # Map codes in data for graph
-            df_filtre['gravite_label'] = df_filtre['grav'].map(gravite_labels)
-            
-            # Count accidents per day and severity
-            accidents_par_jour = df_filtre.groupby(['date', 'gravite_label']).size().reset_index(name='count')
-            
-            fig_yearly = px.line(accidents_par_jour, x='date', y='count', color='gravite_label',
-                                color_discrete_map=gravite_colors,
-                                title="Number of accidents per day in 2024 by severity",
-                                labels={'date': 'Date', 'count': 'Number of accidents', 'gravite_label': 'Severity'})
+            titre = f"Number of accidents per {PERIODS[periode][1]} in {years_label(years)} by severity"
+            if fenetre > 1:
+                titre += f" ({fenetre}-{PERIODS[periode][1]} rolling average)"
+            # Selecting severities only picks columns of the small daily table,
+            # resampled and smoothed only when the figure is not cached yet
+            fig_yearly = cached_figure("evolution", years, filters, lambda: (
+                px.line(analysis.evolution(accidents_par_jour, gravites_selectionnees, PERIODS[periode][0], fenetre),
+                        x='date', y='count', color='grav',
+                        color_discrete_map=gravite_colors,
+                        title=titre,
+                        labels={'date': 'Date', 'count': 'Number of accidents', 'grav': 'Severity'})
+            ), tuple(gravites_selectionnees), periode, fenetre)
             st.plotly_chart(fig_yearly)
         else:
             st.warning("Please select at least one severity to display")
     else:
-        st.warning("No data available for year 2024")
+        st.warning(f"No data available for {years_label(years)}")
 else:
     st.error("Required columns for this analysis are missing.")
 
@@ -130,78 +134,75 @@ st.markdown("---")
 # Interactive map with severity filter
 st.subheader("Interactive accident map")
 
-if 'lat' in df.columns and 'long' in df.columns and 'grav' in df.columns:
-    # Map severity codes
-    gravite_labels_carte = {
-        1: 'Unharmed',
-        2: 'Killed',
-        3: 'Hospitalized injured',
-        4: 'Minor injuries'
-    }
+if 'lat' in columns and 'long' in columns and 'grav' in columns:
+    # Severity codes and labels
+    gravite_labels_carte = LABELS['grav']
+    
+    # Area shown on the map
+    zone_carte = st.selectbox("Area:", list(AREAS), key="carte_zone")
     
     # Severity filter
     gravites_carte = st.multiselect(
         "Select severities to display on map:",
-        options=sorted(df['grav'].unique()),
-        default=sorted(df['grav'].unique()),
+        options=list(gravite_labels_carte),
+        default=list(gravite_labels_carte),
         format_func=lambda x: f"{x} - {gravite_labels_carte.get(x, 'Unknown')}",
         key="carte_gravite"
     )
     
     if gravites_carte:
-        # Filter data
-        df_carte = df[df['grav'].isin(gravites_carte)].copy()
-        
-        # Try to clean and convert coordinates
-        # Replace commas with dots if necessary
-        if df_carte['lat'].dtype == 'object':
-            df_carte['lat'] = df_carte['lat'].astype(str).str.replace(',', '.')
-        if df_carte['long'].dtype == 'object':
-            df_carte['long'] = df_carte['long'].astype(str).str.replace(',', '.')
-        
-        # Convert to numeric
-        df_carte['lat'] = pd.to_numeric(df_carte['lat'], errors='coerce')
-        df_carte['long'] = pd.to_numeric(df_carte['long'], errors='coerce')
-        
-        # Filter valid coordinates (metropolitan France approximately)
-        # Latitude: 41 to 51, Longitude: -5 to 10
-        df_carte = df_carte[
-            (df_carte['lat'].between(41, 51)) & 
-            (df_carte['long'].between(-5, 10))
-        ]
-        
-        st.write(f"Number of valid coordinates found: {len(df_carte)}")
+        # Exact accidents when the area holds few of them, aggregated grid cells otherwise
+        mode_carte, df_carte = map_data(years, zone_carte, gravites_carte, filters)
+        centre_carte, zoom_carte = view(AREAS[zone_carte])
         
         # Check if data remains
         if len(df_carte) == 0:
-            st.warning("No valid geographic coordinates found in the data. The 'lat' and 'long' columns may be empty "
-            "or in an incorrect format.")
-        else:
-            # Limit to 5000 points for performance
-            if len(df_carte) > 10000:
-                df_carte = df_carte.sample(10000)
-                st.info("Displaying a sample of 10000 accidents to optimize performance")
-            
-            # Map severity
-            df_carte['gravite_label'] = df_carte['grav'].map(gravite_labels_carte)
+            st.warning("No valid geographic coordinates found in this area for the selected years.")
+        elif mode_carte == "points":
+            st.write(f"Number of accidents in this area: {len(df_carte)}")
             
             # Create map with Plotly
-            fig_map = px.scatter_mapbox(df_carte,
-                                         lat='lat',
-                                         lon='long',
-                                         color='gravite_label',
-                                         color_discrete_map={
-                                             'Unharmed': '#2ecc71',
-                                             'Killed': '#e74c3c',
-                                             'Hospitalized injured': '#e67e22',
-                                             'Minor injuries': '#f39c12'
-                                         },
-                                         hover_data=['grav', 'dep'],
-                                         zoom=5,
-                                         height=600,
-                                         title="Accident location by severity")
+            fig_map = cached_figure("map_points", years, filters, lambda: (
+                px.scatter_mapbox(df_carte,
+                                   lat='lat',
+                                   lon='long',
+                                   color='grav',
+                                   color_discrete_map={
+                                       'Unharmed': '#2ecc71',
+                                       'Killed': '#e74c3c',
+                                       'Hospitalized injured': '#e67e22',
+                                       'Minor injuries': '#f39c12'
+                                   },
+                                   hover_data=['grav', 'dep'],
+                                   center=centre_carte,
+                                   zoom=zoom_carte,
+                                   height=600,
+                                   title="Accident location by severity")
+                .update_layout(mapbox_style="open-street-map")
+            ), zone_carte, tuple(gravites_carte))
+            st.plotly_chart(fig_map, use_container_width=True)
+        else:
+            st.write(f"Number of accidents in this area: {int(df_carte['count'].sum())}")
+            st.info("Too many accidents to draw one by one: showing counts per grid cell. "
+                    "Pick a smaller area to see individual accidents.")
             
-            fig_map.update_layout(mapbox_style="open-street-map")
+            # One point per grid cell, sized by its number of accidents
+            fig_map = cached_figure("map_cells", years, filters, lambda: (
+                px.scatter_mapbox(df_carte,
+                                   lat='lat',
+                                   lon='long',
+                                   size='count',
+                                   color='count',
+                                   hover_data={'lat': False, 'long': False, 'count': True,
+                                               **{gravite_labels_carte[g]: True for g in gravites_carte}},
+                                   color_continuous_scale=['#f39c12', '#e67e22', '#e74c3c', '#8B0000'],
+                                   size_max=15,
+                                   center=centre_carte,
+                                   zoom=zoom_carte,
+                                   height=600,
+                                   title="Accidents per grid cell")
+                .update_layout(mapbox_style="open-street-map")
+            ), zone_carte, tuple(gravites_carte))
             st.plotly_chart(fig_map, use_container_width=True)
     else:
         st.warning("Please select at least one severity")
@@ -212,4 +213,6 @@ st.markdown("""
 Accidents are spread out across the region, but they are clearly clumped together in and around 
 big cities like Paris, Bordeaux, and Rennes. The map shows that accident problems are concentrated in highly populated areas.""")
 
-st.markdown("---")
\ No newline at end of file
+st.markdown("---")
+
+performance_panel()
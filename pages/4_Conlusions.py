@@ -1,16 +1,8 @@
 
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 
 st.set_page_config(page_title="Conclusions & Recommendations", page_icon="📋", layout="wide")
 
-@st.cache_data
-def load_data():
-    return pd.read_csv('./data/df_dataset.csv')
-
-df = load_data()
-
 st.title("Part 4: Conclusions & Recommendations")
 st.markdown("""
 ## Key Findings
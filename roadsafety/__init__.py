@@ -0,0 +1 @@
+"""Shared data and analysis layer for the Road Safety dashboard."""
@@ -0,0 +1,142 @@
+"""Tables drawn by the dashboard pages, as plain functions.
+
+Each function returns the small DataFrame one chart shows. They take a
+*counter*: a function ``count(by, filters, grain)`` returning the number of
+victims, vehicles or accidents (``grain``, see :mod:`roadsafety.schema`)
+kept by ``filters`` (see :mod:`roadsafety.filters`) grouped by the ``by``
+columns, coded columns labelled, as a DataFrame of the ``by`` columns and
+``count``. In the app it is :func:`roadsafety.data.counter` (cube, bitmaps
+and Streamlit caches); anywhere else :func:`frame_counter` counts the
+victim rows of a DataFrame, so the tables can be computed without Streamlit::
+
+    df = labels.label(schema.read(columns, years=[2024]))
+    analysis.age_groups(analysis.frame_counter(df))
+
+:data:`PAGES` lists the tables of each page, all called as ``f(count, filters)``.
+"""
+
+from roadsafety import departments, filters as filtering, schema, store
+
+# Severities counted as serious accidents.
+SERIOUS = ["Killed", "Hospitalized injured"]
+
+# Speed limits above this are data entry errors.
+MAX_SPEED = 200
+
+
+def frame_counter(df):
+    """Counter over the victim rows of ``df`` (labelled as by :func:`roadsafety.labels.label`).
+
+    Counting vehicles or accidents needs the :func:`roadsafety.schema.grain_keys`
+    of that grain and ``grav`` in ``df``.
+    """
+    def count(by, filters=filtering.NO_FILTERS, grain="victims"):
+        rows = df
+        if grain != "victims":
+            rows = rows.assign(grav=schema.worst_severity(rows, grain))
+        rows = rows[filtering.mask(rows, filters)] if filters else rows
+        if grain != "victims":
+            rows = rows.drop_duplicates(schema.grain_keys(grain))
+        return rows.groupby(list(by), observed=True, dropna=False).size().rename("count").reset_index()
+    return count
+
+
+def _sorted(counts, n=None):
+    counts = counts.sort_values("count", ascending=False)
+    return (counts.head(n) if n else counts).reset_index(drop=True)
+
+
+def age_groups(count, filters=filtering.NO_FILTERS):
+    """Victims per age group, every group of :data:`roadsafety.store.AGE_LABELS` in order."""
+    counts = count(["tranche_age"], filters).set_index("tranche_age")["count"]
+    counts = counts.reindex(store.AGE_LABELS, fill_value=0)
+    return counts.rename_axis("tranche_age").reset_index()
+
+
+def vehicle_categories(count, filters=filtering.NO_FILTERS, n=6):
+    """The ``n`` vehicle categories with the most vehicles involved."""
+    return _sorted(count(["catv"], filters, "vehicles"), n)
+
+
+def trip_types(count, filters=filtering.NO_FILTERS):
+    """Victims per trip type, most frequent first."""
+    return _sorted(count(["trajet"], filters))
+
+
+def user_categories(count, filters=filtering.NO_FILTERS):
+    """Victims per user category (driver, passenger, pedestrian), most frequent first."""
+    return _sorted(count(["catu"], filters))
+
+
+def seat_positions(count, filters=filtering.NO_FILTERS, n=5):
+    """The ``n`` positions in the vehicle with the most victims."""
+    return _sorted(count(["place"], filters), n)
+
+
+def gender_split(count, filters=filtering.NO_FILTERS):
+    """Victims per gender, most frequent first, with their ``share`` in percent."""
+    counts = _sorted(count(["sexe"], filters))
+    total = counts["count"].sum()
+    return counts.assign(share=counts["count"] / total * 100 if total else 0.0)
+
+
+def gender_share(split, gender):
+    """Share in percent of ``gender`` in a :func:`gender_split` table (0 if absent)."""
+    share = split.loc[split["sexe"] == gender, "share"]
+    return float(share.iloc[0]) if len(share) else 0.0
+
+
+def deaths_by_department(count, filters=filtering.NO_FILTERS):
+    """Deaths per department, joined to the department table (names, centroids).
+
+    Every department with a centroid is listed, with 0 deaths if none.
+    """
+    deaths = count(["dep"], filtering.restrict(filters, "grav", ["Killed"]))
+    return departments.with_counts(deaths).dropna(subset=["lat"])
+
+
+def weather(count, filters=filtering.NO_FILTERS):
+    """Accidents per atmospheric condition, most frequent first."""
+    return _sorted(count(["atm"], filters, "accidents"))
+
+
+def surface(count, filters=filtering.NO_FILTERS):
+    """Accidents per surface condition, most frequent first."""
+    return _sorted(count(["surf"], filters, "accidents"))
+
+
+def light(count, filters=filtering.NO_FILTERS):
+    """Accidents per light condition, most frequent first."""
+    return _sorted(count(["lum"], filters, "accidents"))
+
+
+def serious_by_speed_and_road(count, filters=filtering.NO_FILTERS):
+    """Serious accidents per speed limit (up to :data:`MAX_SPEED`) and labelled road type.
+
+    An accident is serious when its worst injury is in :data:`SERIOUS`.
+    """
+    counts = count(["vma", "catr"], filtering.restrict(filters, "grav", SERIOUS), "accidents")
+    return counts[counts["vma"] <= MAX_SPEED].dropna(subset=["catr"]).reset_index(drop=True)
+
+
+def evolution(daily, severities, freq="D", window=1):
+    """Long table (date, grav, count) of the daily counts of ``severities``.
+
+    ``daily`` is a table of counts per day (rows) and severity (columns), as
+    from :func:`roadsafety.data.daily_counts`. Days are summed into periods of
+    pandas frequency ``freq`` (empty periods between non-consecutive years
+    stay gaps) and smoothed by a rolling mean over ``window`` periods.
+    """
+    series = daily[list(severities)]
+    if freq != "D":
+        series = series.resample(freq).sum(min_count=1)
+    if window > 1:
+        series = series.rolling(window, min_periods=1).mean()
+    return series.melt(ignore_index=False, var_name="grav", value_name="count").reset_index()
+
+
+# Tables of each page (the Global Overview draws the KPIs, the daily counts and the map).
+PAGES = {
+    "Users Type": [age_groups, vehicle_categories, trip_types, user_categories, seat_positions, gender_split],
+    "Location & Factors": [deaths_by_department, weather, surface, light, serious_by_speed_and_road],
+}
@@ -0,0 +1,298 @@
+"""Headless benchmark of the load and aggregation paths.
+
+Generates a synthetic year of raw ONISR files (same files, columns and codes
+as the annual releases, random values) of about ``rows`` merged rows, then
+times each stage on it::
+
+    python -m roadsafety.bench                     # 100k rows
+    python -m roadsafety.bench 100k 1M 10M --json bench.json
+
+Stages are the ETL (:func:`roadsafety.etl.build_year`), loading the merged
+rows from the CSV, the single-file Parquet cache and the yearly partitions,
+loading the victim rows from the normalised tables (:mod:`roadsafety.schema`)
+and from the memory-mapped Arrow file (:mod:`roadsafety.shared`), building
+the cube, the aggregations of each page (from the rows and from the cube,
+see :mod:`roadsafety.analysis`) and the map preparation. Each stage reports
+its rows, wall time, throughput and the peak resident memory of the process
+during the stage (:class:`RssReport`; tracing allocations instead, as the
+ETL does, slows pandas down too much to time it).
+
+Everything is written to a temporary directory; nothing under ``data/`` is
+touched and no browser or Streamlit server is needed.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from roadsafety import analysis, bitmap, cube, departments, etl, geo, kpi, labels, schema, shared, store
+from roadsafety.etl import StageReport
+
+YEAR = 2024
+
+# Counts behind the charts, as (group-by columns, grav codes kept or None, grain).
+CUBE_QUERIES = [
+    (["date", "grav"], None, "victims"),
+    (["tranche_age"], None, "victims"),
+    (["catv"], None, "vehicles"),
+    (["trajet"], None, "victims"),
+    (["catu"], None, "victims"),
+    (["place"], None, "victims"),
+    (["sexe"], None, "victims"),
+    (["dep"], [2], "victims"),
+    (["atm"], None, "accidents"),
+    (["surf"], None, "accidents"),
+    (["lum"], None, "accidents"),
+    (["vma", "catr"], [2, 3], "accidents"),
+]
+
+# Distribution of the number of vehicles per accident and users per vehicle.
+VEHICLES_PER_ACCIDENT = ([1, 2, 3], [0.45, 0.45, 0.10])
+USERS_PER_VEHICLE = ([1, 2, 3], [0.75, 0.20, 0.05])
+
+SPEEDS = [30, 50, 70, 80, 90, 110, 130]
+
+
+class RssReport(StageReport):
+    """:class:`roadsafety.etl.StageReport` recording the peak RSS of each stage.
+
+    The peak is reset before each stage through ``/proc/self/clear_refs``
+    (Linux); elsewhere ``peak_mb`` stays None.
+    """
+
+    def __init__(self):
+        super().__init__(trace_memory=False)
+
+    @staticmethod
+    def _reset_peak():
+        try:
+            Path("/proc/self/clear_refs").write_text("5")
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _peak_mb():
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1e3
+        return None
+
+    @contextmanager
+    def stage(self, name):
+        measured = self._reset_peak()
+        t0 = time.perf_counter()
+        info = {"stage": name, "rows": None, "peak_mb": None}
+        try:
+            yield info
+        finally:
+            info["seconds"] = time.perf_counter() - t0
+            if measured:
+                info["peak_mb"] = self._peak_mb()
+            self.stages.append(info)
+
+
+def parse_rows(text):
+    """Row count of a size like '100k', '1M' or '250000'."""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _codes(rng, column, size):
+    return rng.choice(list(labels.LABELS[column]), size=size)
+
+
+def _coord(values):
+    # Raw files use a decimal comma.
+    return pd.Series(values).round(6).astype(str).str.replace(".", ",", regex=False)
+
+
+def generate(rows, raw_dir, year=YEAR, seed=0):
+    """Write synthetic caract/lieux/usagers/vehicules files of ``year`` to ``raw_dir``.
+
+    Users are joined to every vehicle of their accident, as in the ETL, so
+    the number of merged rows is the sum over accidents of users x vehicles;
+    accidents are added until it reaches at most ``rows``. Returns that number.
+    """
+    rng = np.random.default_rng(seed)
+    raw_dir = Path(raw_dir)
+    raw_dir.mkdir(parents=True, exist_ok=True)
+
+    # Vehicles and users of each accident, cut where the merged rows reach ``rows``.
+    vehicles_per_acc = rng.choice(VEHICLES_PER_ACCIDENT[0], size=rows, p=VEHICLES_PER_ACCIDENT[1])
+    vehicle_users = rng.choice(USERS_PER_VEHICLE[0], size=int(vehicles_per_acc.sum()), p=USERS_PER_VEHICLE[1])
+    vehicle_acc = np.repeat(np.arange(rows), vehicles_per_acc)
+    users_per_acc = np.bincount(vehicle_acc, weights=vehicle_users, minlength=rows).astype(np.int64)
+    merged = np.cumsum(users_per_acc * vehicles_per_acc)
+    n_acc = max(int(np.searchsorted(merged, rows, side="right")), 1)
+    n_veh = int(vehicles_per_acc[:n_acc].sum())
+    vehicle_acc, vehicle_users = vehicle_acc[:n_veh], vehicle_users[:n_veh]
+    num_acc = year * 100_000_000 + np.arange(1, n_acc + 1)
+
+    days = pd.Timestamp(f"{year}-01-01") + pd.to_timedelta(rng.integers(0, 365, n_acc), unit="D")
+    deps = departments.table()["code"].to_numpy()
+    pd.DataFrame({
+        "Num_Acc": num_acc, "jour": days.day, "mois": days.month, "an": year,
+        "hrmn": pd.Series(rng.integers(0, 24, n_acc)).map("{:02d}".format) + ":"
+        + pd.Series(rng.integers(0, 60, n_acc)).map("{:02d}".format),
+        "lum": _codes(rng, "lum", n_acc), "dep": rng.choice(deps, n_acc), "com": "75056",
+        "agg": rng.integers(1, 3, n_acc), "int": rng.integers(1, 10, n_acc),
+        "atm": _codes(rng, "atm", n_acc), "col": rng.integers(1, 8, n_acc), "adr": "rue",
+        "lat": _coord(rng.uniform(42.5, 51.0, n_acc)), "long": _coord(rng.uniform(-4.5, 8.0, n_acc)),
+    }).to_csv(raw_dir / f"caract-{year}.csv", sep=";", index=False)
+
+    pd.DataFrame({
+        "Num_Acc": num_acc, "catr": _codes(rng, "catr", n_acc), "voie": "A1", "v1": 0, "v2": "",
+        "circ": rng.integers(1, 5, n_acc), "nbv": rng.integers(1, 5, n_acc), "vosp": 0,
+        "prof": 1, "pr": "(1)", "pr1": "(0)", "plan": 1, "lartpc": "", "larrout": -1,
+        "surf": _codes(rng, "surf", n_acc), "infra": 0, "situ": 1, "vma": rng.choice(SPEEDS, n_acc),
+    }).to_csv(raw_dir / f"lieux-{year}.csv", sep=";", index=False)
+
+    # Vehicles are numbered within their accident (A01, B01...).
+    rank = np.arange(n_veh) - np.repeat(np.cumsum(vehicles_per_acc[:n_acc]) - vehicles_per_acc[:n_acc],
+                                        vehicles_per_acc[:n_acc])
+    num_veh = pd.Series(rank).map(lambda r: f"{chr(65 + r)}01")
+    id_vehicule = pd.Series(np.arange(n_veh)).astype(str)
+    pd.DataFrame({
+        "Num_Acc": num_acc[vehicle_acc], "id_vehicule": id_vehicule, "num_veh": num_veh,
+        "senc": rng.integers(1, 3, n_veh), "catv": _codes(rng, "catv", n_veh),
+        "obs": 0, "obsm": 2, "choc": rng.integers(1, 9, n_veh), "manv": rng.integers(1, 25, n_veh),
+        "motor": 1, "occutc": np.nan,
+    }).to_csv(raw_dir / f"vehicules-{year}.csv", sep=";", index=False)
+
+    user_vehicle = np.repeat(np.arange(n_veh), vehicle_users)
+    n_users = len(user_vehicle)
+    pd.DataFrame({
+        "Num_Acc": num_acc[vehicle_acc[user_vehicle]], "id_usager": pd.Series(np.arange(n_users)).astype(str),
+        "id_vehicule": id_vehicule.to_numpy()[user_vehicle], "num_veh": num_veh.to_numpy()[user_vehicle],
+        "place": _codes(rng, "place", n_users), "catu": _codes(rng, "catu", n_users),
+        "grav": rng.choice([1, 2, 3, 4], n_users, p=[0.42, 0.03, 0.15, 0.40]),
+        "sexe": _codes(rng, "sexe", n_users), "an_nais": rng.integers(1930, year - 5, n_users),
+        "trajet": _codes(rng, "trajet", n_users), "secu1": 1, "secu2": 0, "secu3": -1,
+        "locp": 0, "actp": "0", "etatp": -1,
+    }).to_csv(raw_dir / f"usagers-{year}.csv", sep=";", index=False)
+    return int(merged[n_acc - 1])
+
+
+def run(rows, work_dir, seed=0, trace_memory=False):
+    """Generate ``rows`` synthetic rows in ``work_dir`` and time every stage. Returns the report.
+
+    Peak memory is the RSS of each stage unless ``trace_memory`` is set.
+    """
+    work_dir = Path(work_dir)
+    raw_dir, dataset_dir, cube_dir = work_dir / "raw", work_dir / "dataset", work_dir / "cube"
+    tables_dir = work_dir / "tables"
+    csv_path, parquet_path = work_dir / "df_dataset.csv", work_dir / "df_dataset.parquet"
+    report = StageReport() if trace_memory else RssReport()
+
+    with report.stage("generate") as info:
+        info["rows"] = generate(rows, raw_dir, seed=seed)
+
+    etl.build_year(YEAR, raw_dir, dataset_dir, csv_path=csv_path, report=report, tables_dir=tables_dir)
+
+    with report.stage("load csv") as info:
+        df = store.read_csv(csv_path)
+        info["rows"] = len(df)
+    with report.stage("write parquet cache") as info:
+        store.write_cache(df, csv_path, parquet_path)
+        info["rows"] = len(df)
+    del df
+    single = ds.dataset(parquet_path, format="parquet")
+    partitions = store.open_dataset(csv_path, parquet_path, dataset_dir)
+    for name, dataset in [("cache", single), ("partitions", partitions)]:
+        with report.stage(f"load {name}") as info:
+            info["rows"] = len(store.read_dataset(dataset=dataset))
+        with report.stage(f"load {name} (app cols)") as info:
+            info["rows"] = len(store.read_dataset(columns=store.APP_COLUMNS, dataset=dataset))
+    with report.stage("load tables (app cols)") as info:
+        info["rows"] = len(schema.read(store.APP_COLUMNS, [YEAR], tables_dir=tables_dir))
+    shared_path = work_dir / "dataset.arrow"
+    with report.stage("write shared arrow") as info:
+        info["rows"] = shared.build(store.APP_COLUMNS, partitions, tables_dir, shared_path)
+    with report.stage("map shared (app cols)") as info:
+        mapped = shared.open_shared(shared_path)
+        info["rows"] = len(pd.DataFrame({c: mapped.column(c) for c in mapped.columns}, copy=False))
+
+    with report.stage("build cube") as info:
+        info["rows"] = sum(cube.build_year(YEAR, partitions, cube_dir, tables_dir=tables_dir).values())
+
+    df = schema.read(store.APP_COLUMNS, [YEAR], tables_dir=tables_dir)
+    with report.stage("kpis") as info:
+        kpi.severity_kpis(df)
+        info["rows"] = len(df)
+    with report.stage("label columns") as info:
+        labelled = labels.label(df)
+        info["rows"] = len(df)
+    count = analysis.frame_counter(labelled)
+    for tables in analysis.PAGES.values():
+        for table in tables:
+            with report.stage(f"rows: {table.__name__}") as info:
+                table(count)
+                info["rows"] = len(df)
+    for by, gravs, grain in CUBE_QUERIES:
+        where = {} if gravs is None else {"grav": gravs}
+        with report.stage(f"cube: {','.join(by)}") as info:
+            cells = cube.read_cuboid(cube.cuboid_for(by + list(where), grain), [YEAR], cube_dir)
+            cube.query(cells, by, where)
+            info["rows"] = len(cells)
+    with report.stage("bitmaps") as info:
+        bitmaps = {column: bitmap.build(df[column]) for column in bitmap.INDEXED_COLUMNS}
+        info["rows"] = len(df) * len(bitmaps)
+    with report.stage("bitmap filtered counts") as info:
+        selection = bitmap.all_of([bitmap.any_of(bitmaps["grav"], [2, 3], len(df)),
+                                   bitmap.any_of(bitmaps["lum"], [3, 4, 5], len(df))])
+        for column in ["catv", "catu", "sexe", "trajet", "atm", "surf"]:
+            bitmap.value_counts(bitmaps[column], selection)
+        info["rows"] = len(df)
+
+    bbox = geo.AREAS["Paris"]
+    with report.stage("map: spatial index") as info:
+        index = geo.GridIndex(df["lat"].to_numpy(), df["long"].to_numpy())
+        info["rows"] = len(df)
+    with report.stage("map: points in view") as info:
+        info["rows"] = len(df.iloc[index.viewport(bbox)])
+    with report.stage("map: grid cells") as info:
+        level = geo.grid_level(geo.AREAS["Metropolitan France"])
+        cells = cube.read_cuboid(f"grid_{level}", [YEAR], cube_dir)
+        cells = geo.cells_in_bbox(cells, level, geo.AREAS["Metropolitan France"])
+        geo.severity_cells(cells, level, list(labels.LABELS["grav"]), labels.LABELS["grav"])
+        info["rows"] = len(cells)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard load and aggregation paths.")
+    parser.add_argument("sizes", nargs="*", default=["100k"], help="merged rows, e.g. 100k 1M 10M")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", type=Path, help="keep the generated files there (default: temporary)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="trace Python allocations instead of measuring the RSS (much slower)")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in args.sizes:
+        rows = parse_rows(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            work_dir = args.work_dir / size if args.work_dir else Path(tmp)
+            report = run(rows, work_dir, args.seed, trace_memory=args.trace_memory)
+        print(f"{size} rows")
+        print(report.summary())
+        results[size] = report.stages
+        peaks = [s["peak_mb"] for s in report.stages if s["peak_mb"] is not None]
+        if peaks:
+            print(f"Peak memory: {max(peaks):.0f} MB")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Bitmap indexes over the low-cardinality code columns.
+
+Every cross-filter of the dashboard is an IN predicate over a column with a
+handful of distinct codes. For such a column, :func:`build` keeps one bitmap
+per value: bit ``i`` is set when row ``i`` holds that value. Bitmaps are
+packed 64 rows to a ``uint64`` word, so combining predicates is a bitwise
+OR (values of one column) and AND (across columns) over ``rows / 64`` words,
+and counting the rows of a selection is a popcount.
+
+A bitmap costs ``rows / 8`` bytes per distinct value, against one byte per
+row for the int8 column itself, which is why only :data:`INDEXED_COLUMNS`
+are indexed.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Code columns worth a bitmap per value (a few to a few dozen codes each).
+INDEXED_COLUMNS = ["grav", "catv", "catu", "atm", "surf", "lum", "catr", "sexe", "trajet"]
+
+
+def pack(mask):
+    """Bitmap (uint64 words) of the boolean array ``mask``."""
+    packed = np.packbits(np.asarray(mask, dtype=bool), bitorder="little")
+    padded = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+
+def unpack(words, rows):
+    """Boolean array of the first ``rows`` bits of bitmap ``words``."""
+    return np.unpackbits(words.view(np.uint8), count=rows, bitorder="little").view(bool)
+
+
+def full(rows):
+    """Bitmap with the first ``rows`` bits set."""
+    return pack(np.ones(rows, dtype=bool))
+
+
+def count(words):
+    """Number of bits set in ``words``."""
+    return int(np.bitwise_count(words).sum())
+
+
+def test(words, positions):
+    """Boolean array telling whether each of the row ``positions`` is set."""
+    positions = np.asarray(positions, dtype=np.int64)
+    return ((words[positions >> 6] >> (positions & 63).astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+
+def build(values):
+    """Bitmap of every value of the Series ``values``, as {value: words}.
+
+    Missing values get no bitmap. Categories that never occur get an empty one.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        return {category: pack(codes == i) for i, category in enumerate(values.cat.categories)}
+    array = values.to_numpy()
+    present = sorted(pd.unique(values.dropna()).tolist())
+    return {value: pack(array == value) for value in present}
+
+
+def any_of(bitmaps, values, rows):
+    """Bitmap of the rows holding any of ``values``, from the bitmaps of one column."""
+    selected = np.zeros(-(-rows // 64), dtype=np.uint64)
+    for value in values:
+        if value in bitmaps:
+            selected |= bitmaps[value]
+    return selected
+
+
+def all_of(selections):
+    """Bitmap of the rows set in every bitmap of ``selections`` (at least one)."""
+    selections = list(selections)
+    selected = selections[0].copy()
+    for other in selections[1:]:
+        selected &= other
+    return selected
+
+
+def value_counts(bitmaps, selection=None):
+    """Number of selected rows per value, from the bitmaps of one column."""
+    if selection is None:
+        return {value: count(words) for value, words in bitmaps.items()}
+    buffer = np.empty_like(selection)
+    return {value: count(np.bitwise_and(words, selection, out=buffer)) for value, words in bitmaps.items()}
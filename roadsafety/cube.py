@@ -0,0 +1,215 @@
+"""Precomputed accident counts for the dashboard charts.
+
+Every chart is a count of rows grouped by a few code columns. Instead of
+scanning the raw rows on each rerun, those counts are materialised offline as
+a set of small tables ("cuboids"), one per chart family::
+
+    python -m roadsafety.cube            # all years
+    python -m roadsafety.cube 2024       # just one year
+
+Each cuboid is grouped by ``an`` plus the dimensions listed in
+:data:`CUBOIDS` and stored like the dataset itself, one partition per year
+(``data/cube/<name>/an=<year>/part-0.parquet``), so a year can be rebuilt on
+its own. :func:`query` answers "counts by X where Y" from a cuboid, which is
+independent of the number of raw rows. Years are built, or aggregated on the
+fly (:func:`aggregate_years`), in parallel worker processes
+(:mod:`roadsafety.parallel`; the dashboard aggregates in its own process)::
+
+    python -m roadsafety.cube --workers 8
+
+Each cuboid counts entities of one grain (:data:`GRAINS`, see
+:mod:`roadsafety.schema`): victims by default, vehicles for the vehicle
+categories and accidents for the accident conditions, whose ``grav`` is then
+the accident (or vehicle) severity.
+"""
+
+import argparse
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from roadsafety import geo, parallel, schema, store
+
+CUBE_DIR = store.DATA_DIR / "cube"
+
+# Metadata key recording the grain a cuboid was counted at.
+GRAIN_KEY = b"roadsafety.grain"
+
+# Dimensions of each cuboid (``an`` is always included).
+CUBOIDS = {
+    "base": ["mois", "grav", "dep"],
+    "daily": ["date", "grav"],
+    "age": ["mois", "grav", "dep", "tranche_age"],
+    "catv": ["mois", "grav", "dep", "catv"],
+    "trajet": ["mois", "grav", "dep", "trajet"],
+    "catu": ["mois", "grav", "dep", "catu"],
+    "place": ["mois", "grav", "dep", "place"],
+    "sexe": ["mois", "grav", "dep", "sexe"],
+    "atm": ["mois", "grav", "dep", "atm"],
+    "surf": ["mois", "grav", "dep", "surf"],
+    "lum": ["mois", "grav", "dep", "lum"],
+    "vma_catr": ["grav", "vma", "catr"],
+}
+
+# Grain of the cuboids not counting victims (see roadsafety.schema.GRAINS).
+GRAINS = {
+    "catv": "vehicles",
+    "atm": "accidents",
+    "surf": "accidents",
+    "lum": "accidents",
+    "vma_catr": "accidents",
+}
+
+# Columns derived from the raw ones before aggregating: name -> (source, function).
+# (Derived columns stored in the dataset, e.g. tranche_age, are read as is.)
+DERIVED = {}
+
+# Map grids, one cuboid per resolution (see roadsafety.geo).
+for _level, _size in enumerate(geo.GRID_SIZES):
+    _lat, _lon = geo.cell_column("lat", _level), geo.cell_column("lon", _level)
+    DERIVED[_lat] = ("lat", lambda s, size=_size: geo.cell_index(s, size))
+    DERIVED[_lon] = ("long", lambda s, size=_size: geo.cell_index(s, size))
+    CUBOIDS[f"grid_{_level}"] = ["grav", _lat, _lon]
+
+
+def source_columns(name):
+    """Raw dataset columns needed to build cuboid ``name``."""
+    return ["an"] + [DERIVED[d][0] if d in DERIVED else d for d in CUBOIDS[name]]
+
+
+def grain(name):
+    """Grain of the entities counted by cuboid ``name``."""
+    return GRAINS.get(name, "victims")
+
+
+def cuboid_for(dims, grain="victims"):
+    """Smallest cuboid of ``grain`` holding every dimension of ``dims`` (besides ``an``), or None."""
+    dims = set(dims) - {"an"}
+    candidates = [name for name, cuboid_dims in CUBOIDS.items()
+                  if dims <= set(cuboid_dims) and GRAINS.get(name, "victims") == grain]
+    return min(candidates, key=lambda name: len(CUBOIDS[name]), default=None)
+
+
+def source_rows(name, years, dataset=None, tables_dir=schema.TABLES_DIR):
+    """Rows of the grain of cuboid ``name`` for ``years``, with its :func:`source_columns`."""
+    return schema.read(source_columns(name), years, grain(name), dataset, tables_dir)
+
+
+def aggregate(df, name):
+    """Compute cuboid ``name`` from rows ``df`` of its grain (see :func:`source_rows`)."""
+    dims = ["an"] + CUBOIDS[name]
+    keys = [DERIVED[d][1](df[DERIVED[d][0]]).rename(d) if d in DERIVED else df[d] for d in dims]
+    counts = pd.Series(1, index=df.index, dtype="int32").groupby(keys, observed=True, dropna=False).sum()
+    return counts.rename("count").reset_index()
+
+
+def aggregate_year(year, name, dataset=None, tables_dir=schema.TABLES_DIR):
+    """Cells of cuboid ``name`` for ``year``, aggregated from its source rows."""
+    return aggregate(source_rows(name, [year], dataset, tables_dir), name)
+
+
+def combine(parts):
+    """Cells of a cuboid summing the partial cells of the list ``parts``."""
+    if len(parts) == 1:
+        return parts[0]
+    cells = pd.concat(parts, ignore_index=True)
+    dims = [c for c in cells.columns if c != "count"]
+    return cells.groupby(dims, observed=True, dropna=False, sort=False)["count"].sum().reset_index()
+
+
+def aggregate_years(name, years, dataset=None, tables_dir=schema.TABLES_DIR, workers=None):
+    """Cells of cuboid ``name`` for ``years``, one year per worker process."""
+    return parallel.map_reduce(aggregate_year, years, combine, name, dataset, tables_dir, workers=workers)
+
+
+def cuboid_path(name, year, cube_dir=CUBE_DIR):
+    return Path(cube_dir) / name / f"an={year}" / "part-0.parquet"
+
+
+def build_year(year, dataset=None, cube_dir=CUBE_DIR, names=None, tables_dir=schema.TABLES_DIR):
+    """(Re)build every cuboid of ``year``. Returns {name: number of cells}."""
+    dataset = dataset or store.open_dataset()
+    available = set(store.dataset_columns(dataset))
+    names = [n for n in (names or CUBOIDS) if set(source_columns(n)) <= available]
+    # The columns of all the cuboids of a grain are read at once.
+    rows = {}
+    for g in sorted({grain(n) for n in names}):
+        columns = sorted({c for n in names if grain(n) == g for c in source_columns(n)})
+        rows[g] = schema.read(columns, [year], g, dataset, tables_dir)
+
+    sizes = {}
+    for name in names:
+        cells = aggregate(rows[grain(name)], name)
+        path = cuboid_path(name, year, cube_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        table = pa.Table.from_pandas(cells, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), GRAIN_KEY: grain(name).encode()})
+        pq.write_table(table, tmp_path)
+        tmp_path.replace(path)
+        sizes[name] = len(cells)
+    return sizes
+
+
+def build_cube(years=None, dataset=None, cube_dir=CUBE_DIR, tables_dir=schema.TABLES_DIR, workers=None):
+    """Build the cuboids of ``years`` (default: every year in the dataset), one year per worker.
+
+    Returns [(year, {name: number of cells})].
+    """
+    dataset = dataset or store.open_dataset()
+    years = years or store.available_years(dataset)
+    return parallel.map_years(build_year, years, dataset, cube_dir, tables_dir=tables_dir, workers=workers)
+
+
+def is_fresh(name, year, dataset, cube_dir=CUBE_DIR, tables_dir=schema.TABLES_DIR):
+    """True if cuboid ``name`` of ``year`` exists with its current dimensions
+    and grain and is newer than its source rows (and tables, if any)."""
+    path = cuboid_path(name, year, cube_dir)
+    if not path.exists():
+        return False
+    stored = pq.read_schema(path)
+    if not set(CUBOIDS[name]) <= set(stored.names) or (stored.metadata or {}).get(GRAIN_KEY) != grain(name).encode():
+        return False
+    source = store.source_mtime(dataset, year)
+    tables = schema.source_mtime(year, tables_dir)
+    if source is not None and tables is not None:
+        source = max(source, tables)
+    return source is not None and path.stat().st_mtime >= source
+
+
+def read_cuboid(name, years, cube_dir=CUBE_DIR):
+    """Read the stored cells of cuboid ``name`` for ``years``."""
+    cuboid = ds.dataset(Path(cube_dir) / name, format="parquet", partitioning=store.PARTITIONING)
+    table = cuboid.to_table(filter=store.year_filter(years))
+    return table.to_pandas(ignore_metadata=True)
+
+
+def query(cells, by, where=None):
+    """Sum the counts of ``cells`` grouped by ``by``, keeping rows matching ``where``.
+
+    ``where`` maps a dimension to the list of values to keep, e.g.
+    ``{"grav": [2, 3]}``. Returns a DataFrame with the ``by`` columns and
+    ``count``, sorted by ``by``.
+    """
+    for col, values in (where or {}).items():
+        cells = cells[cells[col].isin(values)]
+    counts = cells.groupby(list(by), observed=True, dropna=False)["count"].sum()
+    return counts.reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the dashboard aggregate cube.")
+    parser.add_argument("years", type=int, nargs="*", help="years to (re)build (default: all)")
+    parser.add_argument("--out-dir", type=Path, default=CUBE_DIR)
+    parser.add_argument("--workers", type=int, help=f"worker processes (default: {parallel.WORKERS})")
+    args = parser.parse_args(argv)
+
+    for year, sizes in build_cube(args.years, cube_dir=args.out_dir, workers=args.workers):
+        print(f"{year}: {sum(sizes.values()):,} cells in {len(sizes)} cuboids")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,636 @@
+"""Shared access to the merged ONISR dataset.
+
+Every page of the dashboard reads the same rows through :func:`load_dataset`,
+cached once per Streamlit server process instead of once per page or session.
+Columns are read and cached one by one, the first time a page asks for them,
+and :func:`load_dataset` returns a new DataFrame over the cached columns
+without copying them. pandas Copy-on-Write is enabled for the app, so a page
+may filter, assign to or even modify the frame it gets: only what it writes
+is copied, and the shared columns never change.
+
+Only the years picked in the sidebar (:func:`select_years`) are loaded, so the
+full 2005-2024 series never has to sit in memory at once. Charts that only
+need counts go through :func:`query`, which reads the precomputed cube and
+does not load any rows at all.
+
+The sidebar also holds cross-filters (:func:`select_filters`, see
+:mod:`roadsafety.filters`) applied by :func:`counts`, :func:`kpis`,
+:func:`daily_counts` and :func:`map_data`. Counts are still read from the
+cube when a cuboid holds all the filtered columns. Otherwise the rows are
+selected by a mask cached per filtered column and combined per filter
+state, so changing one filter only recomputes the mask of that column and
+the charts that depend on it. Masks are bitmaps (:mod:`roadsafety.bitmap`):
+the code columns get one cached bitmap per value, so a filter on them is an
+OR of bitmaps, filter states are ANDs, and counts by a code column are
+popcounts.
+
+Rows are victims: each user once, with its own vehicle, read from the
+normalised tables of :mod:`roadsafety.schema` when they are built (only the
+tables holding a requested column are read). :func:`counts` counts victims,
+vehicles or accidents (its ``grain``). When ``data/dataset.arrow`` is built
+for the current data (:mod:`roadsafety.shared`), columns are instead views
+of that memory-mapped file, shared by every server process of the host.
+
+Plotly figures are cached too, as JSON shared by all sessions
+(:func:`cached_figure`).
+
+The data is served from a :class:`roadsafety.snapshot.Snapshot` of
+``data/``, reloaded in the background when the files change: a new CSV,
+an ingested year, a rebuilt memory-mapped file... The new snapshot is warmed
+up (:mod:`roadsafety.warmup`) before it is swapped in, so no session waits
+for the reload and none of them reloads anything itself. Every cache entry
+is keyed by the data version of the years it holds (:func:`data_version`),
+so the entries of the other years are still used. Entries of the years that
+changed are no longer looked up: the large ones (columns, bitmaps, spatial
+indexes, cuboids) are dropped at the swap, the small results age out of
+their bounded Streamlit caches.
+
+Every public function runs in a :mod:`roadsafety.perf` section recording its
+duration, the rows it scanned and its payload; :func:`performance_panel`
+shows them per rerun in developer mode (``?perf=1`` or ``ROADSAFETY_PERF=1``).
+"""
+
+import functools
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from roadsafety import bitmap, cube, departments, figures, geo, kpi, labels, perf, schema, snapshot, store
+from roadsafety import filters as filtering
+
+# Views of the cached columns are never written through (see above).
+pd.set_option("mode.copy_on_write", True)
+
+# Columns the dashboard pages may load; everything else stays on disk.
+APP_COLUMNS = store.APP_COLUMNS
+
+# Official description of the database (served from the home page).
+DOCUMENTATION_PDF = Path("./description-des-bases-de-donnees-annuelles.pdf")
+
+# Distinct year selections kept in memory at once (each holds its rows).
+MAX_CACHED_SELECTIONS = 4
+
+# Columns used by the maps and KPIs.
+MAP_COLUMNS = ["lat", "long", "grav", "dep"]
+KPI_COLUMNS = ["Num_Acc", "grav"]
+
+
+# Snapshot used by the current thread instead of the watcher's, see _warm.
+_local = threading.local()
+
+
+def _load_snapshot():
+    return snapshot.Snapshot.load(APP_COLUMNS)
+
+
+@contextmanager
+def _pinned(pinned):
+    _local.snapshot = pinned
+    try:
+        yield
+    finally:
+        _local.snapshot = None
+
+
+def _warm(candidate):
+    # Compute the default aggregates of a new snapshot before it is swapped in.
+    from roadsafety import warmup
+
+    with _pinned(candidate):
+        warmup.warm_up()
+
+
+# Caches of the values computed from the data, see _versioned.
+_VERSIONED = {}
+
+
+def _versioned(max_entries, spinner=None):
+    # Cache a function of (years, version, *args) in a VersionedCache, whose
+    # entries of replaced versions are dropped by _invalidate.
+    def decorate(function):
+        cache = _VERSIONED[function.__name__] = snapshot.VersionedCache(max_entries)
+
+        def compute(args):
+            if spinner is None:
+                return function(*args)
+            with st.spinner(spinner):
+                return function(*args)
+
+        @functools.wraps(function)
+        def cached(years, version, *args):
+            key = (years, version, *args)
+            return cache.get(key, lambda: compute(key))
+        return cached
+    return decorate
+
+
+def _invalidate(previous, current):
+    # Values and figures of the old data of the years that changed.
+    for cache in _VERSIONED.values():
+        cache.discard(previous, current)
+    if previous.cube != current.cube:
+        # Rebuilt cuboids: read them instead of the counts aggregated meanwhile.
+        _VERSIONED["_cuboid"].clear()
+    _figure_cache().discard(lambda key: key[-1] != current.version_of(key[1]))
+
+
+@st.cache_resource(show_spinner=False)
+def _watcher():
+    watcher = snapshot.Watcher(_load_snapshot, prepare=_warm, on_swap=_invalidate).start()
+    # Warm the first snapshot up too, in the background, whichever page the
+    # server is asked for first.
+    threading.Thread(target=lambda: _warm(watcher.current()), name="roadsafety-warmup", daemon=True).start()
+    return watcher
+
+
+def _snapshot(years=None, version=None):
+    # The snapshot serving ``version`` of ``years`` (default: the current one):
+    # an entry keyed by a version is always computed from that version.
+    current = getattr(_local, "snapshot", None) or _watcher().current()
+    if version is None or current.version_of(years) == version:
+        return current
+    for kept in _watcher().recent():
+        if kept.version_of(years) == version:
+            return kept
+    raise LookupError(f"Data version {version} of {years} is no longer loaded; rerun to use the current one")
+
+
+def _key(years):
+    # Sorted years and their data version, the leading arguments of the cached functions.
+    years = tuple(sorted(years)) if years is not None else None
+    return years, _snapshot().version_of(years)
+
+
+def available_years():
+    return _snapshot().years
+
+
+def available_columns():
+    return _snapshot().columns
+
+
+@_versioned(MAX_CACHED_SELECTIONS * len(APP_COLUMNS), spinner="Loading accident data...")
+def _column(years, version, name):
+    data = _snapshot(years, version)
+    if data.shared is not None:
+        # A view of the mapped file: no copy in this process.
+        column = data.shared.column(name, years)
+        perf.scanned(len(column))
+        return column
+    # Every column of a selection is read with the same filter, in the same
+    # (fragment) order, so the cached columns line up row by row.
+    column = schema.read([name], years, dataset=data.dataset)[name]
+    perf.scanned(len(column))
+    # Coded columns are held as labelled categoricals (int8 codes + labels).
+    return labels.categorical(column, name) if name in labels.LABELS else column
+
+
+def _load(years, version, columns):
+    available = set(_snapshot(years, version).columns)
+    return pd.DataFrame({c: _column(years, version, c) for c in columns if c in available}, copy=False)
+
+
+def _app_columns(columns):
+    columns = APP_COLUMNS if columns is None else list(columns)
+    unknown = set(columns) - set(APP_COLUMNS)
+    if unknown:
+        raise ValueError(f"Columns not served to the pages: {sorted(unknown)}; add them to APP_COLUMNS")
+    return columns
+
+
+@perf.timed
+def load_dataset(years=None, columns=None):
+    """Rows of ``years`` (default: all) projected on ``columns`` (default: :data:`APP_COLUMNS`).
+
+    Columns missing from the dataset are left out. The frame is built over
+    the shared cached columns and can be used freely (see the module docstring).
+    """
+    return _load(*_key(years), _app_columns(columns))
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _preview(years, version, rows, active):
+    columns = [c for c in APP_COLUMNS if c not in store.DERIVED_COLUMNS]
+    selected = None
+    if active:
+        # Only read up to the last of the first selected rows: the rows come
+        # in the order of the cached columns the selection was made on.
+        selected = np.flatnonzero(_selected_rows(years, version, active))[:rows]
+        rows = int(selected[-1]) + 1 if len(selected) else 0
+    perf.scanned(rows)
+    df = labels.label(schema.preview(columns, years, _snapshot(years, version).dataset, rows=rows))
+    return df if selected is None else df.iloc[selected].reset_index(drop=True)
+
+
+@perf.timed
+def preview(years, rows=10, filters=filtering.NO_FILTERS):
+    """First ``rows`` rows of the selected years kept by ``filters``.
+
+    Without filters, the dataset is not loaded: only the first rows are read.
+    """
+    df = _preview(*_key(years), rows, filters)
+    perf.payload(df.memory_usage(deep=True).sum())
+    return df
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _summary(years, version, active):
+    perf.missed()
+    data = _snapshot(years, version)
+    severities = _counts(years, version, ("grav",), active).set_index("grav")["count"]
+    rows = int(severities.sum()) if active else schema.count_rows(years, "victims", data.dataset)
+    summary = {
+        "rows": rows,
+        "columns": len(data.columns),
+        "years": list(years),
+    }
+    for name, code in kpi.SEVERITY_CODES.items():
+        summary[name] = int(severities.get(labels.LABELS["grav"][code], 0))
+    return summary
+
+
+@perf.timed
+def summary(years, filters=filtering.NO_FILTERS):
+    """Victim (row) count, column count and victims per severity of the selected years kept by ``filters``.
+
+    Read from the Parquet metadata and the cube: no row is loaded unless a
+    filter needs it (see :func:`counts`).
+    """
+    return _summary(*_key(years), filters)
+
+
+@st.cache_resource(show_spinner=False)
+def _documentation_pdf():
+    return DOCUMENTATION_PDF.read_bytes()
+
+
+@perf.timed
+def documentation_pdf():
+    """Bytes of the database description PDF, read once per server."""
+    pdf = _documentation_pdf()
+    perf.payload(len(pdf))
+    return pdf
+
+
+@st.cache_resource(show_spinner=False)
+def _figure_cache():
+    return figures.FigureCache()
+
+
+def data_version(years=None):
+    """Version of the data served for ``years`` (default: all), part of every
+    cache key that outlives a rerun.
+
+    Adding or replacing a year does not change the version of the others.
+    """
+    return _snapshot().version_of(years)
+
+
+def cached_figure(chart, years, filters, build, *params):
+    """Figure ``chart`` of the selected years and filters, built by ``build()`` once.
+
+    ``params`` are the other inputs of the chart (widget values...). The
+    figure is shared by all sessions through a :class:`roadsafety.figures.FigureCache`
+    keyed by all of them and the data version of the selected years.
+    """
+    key = (chart, tuple(sorted(years)), filters, params, data_version(years))
+    with perf.section(f"figure {chart}"):
+        return _figure_cache().figure(key, build)
+
+
+@perf.timed
+def filtered_dataset(years, filters, columns=None):
+    """Rows of ``years`` kept by ``filters``, projected as in :func:`load_dataset`."""
+    years, version = _key(years)
+    df = _load(years, version, _app_columns(columns))
+    return df[_selected_rows(years, version, filters)] if filters else df
+
+
+@_versioned(64)
+def _cuboid(years, version, name):
+    dataset = _snapshot(years, version).dataset
+    fresh = [y for y in years if cube.is_fresh(name, y, dataset)]
+    stale = [y for y in years if y not in fresh]
+    parts = []
+    if fresh:
+        parts.append(cube.read_cuboid(name, fresh))
+        perf.scanned(len(parts[0]))
+    if stale:
+        # Cube not built (or older than the data) for these years: aggregate
+        # the few columns needed straight from the dataset, in this process.
+        perf.missed()
+        parts.append(cube.aggregate_years(name, stale, dataset, workers=1))
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+
+@_versioned(MAX_CACHED_SELECTIONS * len(bitmap.INDEXED_COLUMNS), spinner="Indexing accident data...")
+def _bitmaps(years, version, column):
+    values = _load(years, version, [column])[column]
+    perf.scanned(len(values))
+    return bitmap.build(values)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _row_count(years, version):
+    return len(_column(years, version, "an"))
+
+
+@_versioned(MAX_CACHED_SELECTIONS * 8 * len(filtering.FILTERS))
+def _filter_bits(years, version, column, values):
+    if column in bitmap.INDEXED_COLUMNS:
+        return bitmap.any_of(_bitmaps(years, version, column), values, _row_count(years, version))
+    # Departments and age groups have too many values (or none to index):
+    # build the bitmap of this filter only.
+    rows = _load(years, version, [column])
+    perf.scanned(len(rows))
+    return bitmap.pack(filtering.mask(rows, ((column, values),)))
+
+
+@_versioned(64)
+def _selection(years, version, active):
+    # One cached bitmap per filtered column: changing a filter only recomputes
+    # the bitmap of that column, the others are reused as they are.
+    perf.missed()
+    if not active:
+        return bitmap.full(_row_count(years, version))
+    return bitmap.all_of(_filter_bits(years, version, column, values) for column, values in active)
+
+
+def _selected_rows(years, version, active):
+    return bitmap.unpack(_selection(years, version, active), _row_count(years, version))
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _kpis(years, version, active):
+    mask = _selected_rows(years, version, active) if active else None
+    rows = _load(years, version, KPI_COLUMNS)
+    perf.scanned(len(rows))
+    return kpi.severity_kpis(rows, mask)
+
+
+@perf.timed
+def kpis(years, filters=filtering.NO_FILTERS):
+    """Severity KPIs of the selected rows, see :func:`roadsafety.kpi.severity_kpis`."""
+    return _kpis(*_key(years), filters)
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _query(name, years, version, by, where):
+    cells = _cuboid(years, version, name)
+    perf.scanned(len(cells))
+    counts = labels.label(cube.query(cells, list(by), dict(where)))
+    if not any(c in labels.LABELS for c in by):
+        return counts
+    # Codes sharing a label are counted together.
+    return counts.groupby(list(by), observed=True, dropna=False, sort=False)["count"].sum().reset_index()
+
+
+@perf.timed
+def query(name, years, by, where=None):
+    """Counts from cuboid ``name`` of the cube, see :func:`roadsafety.cube.query`.
+
+    Coded columns of ``by`` come back as labelled categoricals
+    (:mod:`roadsafety.labels`); ``where`` still takes codes.
+    """
+    where = tuple((col, tuple(values)) for col, values in (where or {}).items())
+    return _query(name, *_key(years), tuple(by), where)
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _counts(years, version, by, active, grain="victims"):
+    name = cube.cuboid_for(list(by) + filtering.columns(active), grain)
+    if name is not None:
+        where = tuple((col, tuple(codes)) for col, codes in filtering.where(active).items())
+        return _query(name, years, version, by, where)
+    if grain != "victims":
+        # Accidents or vehicles with a victim kept by the filters, their
+        # severity being the worst of all their victims, as in the cube.
+        keys = schema.grain_keys(grain)
+        rows = _load(years, version, list(dict.fromkeys([*by, *filtering.columns(active), *keys, "grav"])))
+        perf.scanned(len(rows))
+        rows = rows.assign(grav=schema.worst_severity(rows, grain))
+        rows = rows[filtering.mask(rows, active)].drop_duplicates(keys)
+        return rows.groupby(list(by), observed=True, dropna=False).size().rename("count").reset_index()
+    if len(by) == 1 and by[0] in bitmap.INDEXED_COLUMNS:
+        # One popcount per value of the column, no row is touched.
+        selection = _selection(years, version, active)
+        perf.scanned(_row_count(years, version))
+        counted = {v: n for v, n in bitmap.value_counts(_bitmaps(years, version, by[0]), selection).items() if n}
+        missing = bitmap.count(selection) - sum(counted.values())
+        if missing:
+            counted[None] = missing
+        values = list(counted)
+        if by[0] in labels.LABELS:
+            values = pd.Categorical(values, dtype=labels.dtype(by[0]))
+        return pd.DataFrame({by[0]: values, "count": list(counted.values())})
+    rows = _load(years, version, by)[_selected_rows(years, version, active)]
+    perf.scanned(len(rows))
+    return rows.groupby(list(by), observed=True, dropna=False).size().rename("count").reset_index()
+
+
+def counts(years, by, filters=filtering.NO_FILTERS, grain="victims"):
+    """Number of ``grain`` entities of the selected years kept by ``filters``, grouped by ``by``.
+
+    ``grain`` is one of :data:`roadsafety.schema.GRAINS` (victims, vehicles
+    or accidents). Answered from the smallest cuboid of that grain holding
+    ``by`` and the filtered columns when there is one, else counted over the
+    rows selected by the cached filter masks. Coded columns come back
+    labelled, as with :func:`query`.
+    """
+    with perf.section(f"counts {','.join(by)}" + ("" if grain == "victims" else f" ({grain})")):
+        return _counts(*_key(years), tuple(by), filters, grain)
+
+
+def counter(years):
+    """:func:`counts` of the selected years, as the counter of :mod:`roadsafety.analysis`."""
+    return functools.partial(counts, years)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _daily_counts(years, version, active):
+    perf.missed()
+    cells = _counts(years, version, ("date", "grav"), active)
+    table = cells.pivot_table(index="date", columns="grav", values="count", aggfunc="sum",
+                              fill_value=0, observed=False)
+    # Every day of the selected years, including the days without accidents.
+    days = pd.DatetimeIndex([]).append([pd.date_range(f"{y}-01-01", f"{y}-12-31") for y in years])
+    table = table.reindex(index=days, columns=list(labels.dtype("grav").categories), fill_value=0)
+    return table.rename_axis(index="date", columns="grav")
+
+
+@perf.timed
+def daily_counts(years, filters=filtering.NO_FILTERS):
+    """Rows kept by ``filters`` per day (rows) and severity label (columns) of the selected years."""
+    return _daily_counts(*_key(years), filters)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _map_cells(years, version, bbox, gravs, active):
+    level = geo.grid_level(bbox)
+    if active:
+        # Grid the selected rows of the area instead of reading the cuboid.
+        rows = _spatial_index(years, version).viewport(bbox)
+        rows = rows[bitmap.test(_selection(years, version, active), rows)]
+        points = _load(years, version, ["an", "lat", "long", "grav"]).iloc[rows]
+        cells = cube.aggregate(points.assign(grav=labels.codes(points["grav"], "grav")), f"grid_{level}")
+    else:
+        cells = _cuboid(years, version, f"grid_{level}")
+    perf.scanned(len(cells))
+    cells = geo.cells_in_bbox(cells[cells["grav"].isin(gravs)], level, bbox)
+    cells = geo.severity_cells(cells, level, gravs, labels.LABELS["grav"])
+    return cells.drop(columns=list(geo.cell_columns(level)))
+
+
+@_versioned(MAX_CACHED_SELECTIONS, spinner="Indexing accident locations...")
+def _spatial_index(years, version):
+    df = _load(years, version, ["lat", "long"])
+    perf.scanned(len(df))
+    return geo.GridIndex(df["lat"].to_numpy(), df["long"].to_numpy())
+
+
+@perf.timed
+def accidents_in_view(years, bbox, columns=MAP_COLUMNS):
+    """Rows of the selected years inside ``bbox`` (lat_min, lat_max, lon_min, lon_max)."""
+    years, version = _key(years)
+    rows = _spatial_index(years, version).viewport(bbox)
+    return _load(years, version, _app_columns(columns)).iloc[rows]
+
+
+@perf.timed
+def accidents_near(years, lat, lon, km, columns=MAP_COLUMNS):
+    """Rows of the selected years within ``km`` of (lat, lon), nearest first, with ``distance_km``."""
+    years, version = _key(years)
+    rows, dist = _spatial_index(years, version).radius(lat, lon, km)
+    return _load(years, version, _app_columns(columns)).iloc[rows].assign(distance_km=dist)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _map_points(years, version, bbox, gravs, active):
+    rows = _spatial_index(years, version).viewport(bbox)
+    if active:
+        rows = rows[bitmap.test(_selection(years, version, active), rows)]
+    points = _load(years, version, MAP_COLUMNS).iloc[rows]
+    perf.scanned(len(points))
+    return points[points["grav"].isin([labels.LABELS["grav"][g] for g in gravs])]
+
+
+@perf.timed
+def map_data(years, area, gravs, filters=filtering.NO_FILTERS):
+    """Accidents of ``area`` (a key of :data:`roadsafety.geo.AREAS`) to draw on a map.
+
+    Returns ``("points", rows)`` when the area holds at most
+    :data:`roadsafety.geo.MAX_POINTS` accidents, else ``("cells", cells)``
+    with one row per grid cell: its centre, ``count`` and a count per severity.
+    Either way the payload is bounded, whatever the number of years loaded.
+    ``gravs`` are severity codes; ``filters`` further restricts the accidents.
+    """
+    (years, version), gravs, bbox = _key(years), tuple(sorted(gravs)), geo.AREAS[area]
+    cells = _map_cells(years, version, bbox, gravs, filters)
+    if cells["count"].sum() <= geo.MAX_POINTS:
+        return "points", _map_points(years, version, bbox, gravs, filters)
+    return "cells", cells
+
+
+def _sidebar_multiselect(label, options, key, default, **kwargs):
+    # Widget state is dropped on pages without the widget, so the selection
+    # is mirrored in a plain session key and restored from it.
+    previous = st.session_state.get(key, st.session_state.get(f"selected_{key}", default))
+    st.session_state[key] = [v for v in previous if v in options]
+    selected = st.sidebar.multiselect(label, options, key=key, **kwargs)
+    st.session_state[f"selected_{key}"] = selected
+    return selected
+
+
+def select_years():
+    """Sidebar year selector shared by all pages; returns the selected years.
+
+    Defaults to the latest year. Stops the page if nothing is selected.
+    """
+    years = available_years()
+    selected = _sidebar_multiselect("Years", years, "years", years[-1:])
+    if not selected:
+        st.warning("Please select at least one year in the sidebar")
+        st.stop()
+    return selected
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _department_options(years, version):
+    codes = _query("base", years, version, ("dep",), ())["dep"].dropna().astype(str)
+    names = departments.table().set_index("code")["name"]
+    return {code: f"{code} - {names.get(departments.normalise_code(code), '?')}" for code in sorted(set(codes))}
+
+
+@perf.timed
+def department_options(years):
+    """Department codes present in the selected years, with their display names."""
+    return _department_options(*_key(years))
+
+
+def select_filters(years):
+    """Sidebar cross-filters shared by all pages; returns the filter state.
+
+    Nothing is filtered by default. See :mod:`roadsafety.filters`.
+    """
+    available = set(available_columns())
+    selection = {}
+    st.sidebar.markdown("**Filters**")
+    for column, title in filtering.FILTERS.items():
+        if column not in available:
+            continue
+        if column == "dep":
+            names = department_options(years)
+            selection[column] = _sidebar_multiselect(title, list(names), "filter_dep", [],
+                                                     format_func=names.get, placeholder="All")
+        else:
+            selection[column] = _sidebar_multiselect(title, filtering.options(column), f"filter_{column}", [],
+                                                     placeholder="All")
+    return filtering.make(selection)
+
+
+def _developer_mode():
+    return os.environ.get("ROADSAFETY_PERF") == "1" or st.query_params.get("perf") == "1"
+
+
+def performance_panel():
+    """End the rerun recorded by :mod:`roadsafety.perf` and show it in the sidebar.
+
+    Call it last on a page that called :func:`roadsafety.perf.begin`. The
+    panel is only shown in developer mode (``?perf=1`` in the URL or
+    ``ROADSAFETY_PERF=1``); the rerun is logged either way when
+    :data:`roadsafety.perf.LOG_PATH` is set.
+    """
+    rerun = perf.end()
+    if rerun is None or not _developer_mode():
+        return
+    with st.sidebar.expander("Performance"):
+        sections = pd.DataFrame(rerun["sections"], columns=["name", "seconds", "rows", "bytes", "cached"])
+        data = _snapshot()
+        st.write(f"Data version {data.version}, loaded at {data.loaded:%H:%M:%S}")
+        st.write(f"Rerun of {rerun['page']}: {rerun['seconds'] * 1000:.0f} ms, "
+                 f"{int(sections['cached'].sum())}/{len(sections)} sections from cache")
+        st.dataframe(sections.assign(ms=(sections.pop("seconds") * 1000).round(1)), hide_index=True)
+        cache = _figure_cache()
+        lookups = cache.hits + cache.misses
+        st.write(f"Figure cache: {len(cache)} figures, {cache.bytes / 1e6:.1f} MB, "
+                 f"hit ratio {cache.hits / lookups if lookups else 0:.0%}")
+        totals = pd.DataFrame.from_dict(perf.totals(), orient="index")
+        if len(totals):
+            totals["hit ratio"] = (totals["hits"] / totals["calls"]).round(2)
+            st.write("Since the server started:")
+            st.dataframe(totals.sort_values("seconds", ascending=False))
+
+
+def years_label(years):
+    """Human readable form of a year selection, e.g. '2024' or '2019-2024'."""
+    years = sorted(years)
+    if len(years) == 1:
+        return str(years[0])
+    if years == list(range(years[0], years[-1] + 1)):
+        return f"{years[0]}-{years[-1]}"
+    return ", ".join(str(y) for y in years)
@@ -0,0 +1,134 @@
+"""Reference table of the French departments found in the ONISR data.
+
+``departments.csv`` (shipped with the package) lists every department code
+used by the annual files, with its name and an approximate centroid, including
+Corsica (2A/2B) and the overseas departments and collectivities (97x, 98x).
+
+Department boundaries are downloaded once, to :data:`GEOJSON_PATH`, for the
+choropleths (the simplified metropolitan boundaries of the france-geojson
+project, :data:`GEOJSON_URL`)::
+
+    python -m roadsafety.departments
+
+``python -m roadsafety.warmup`` also downloads them if they are missing. Any
+GeoJSON of the departments with a ``code`` property can be put there instead.
+"""
+
+import argparse
+import json
+import os
+import urllib.request
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+from roadsafety.store import DATA_DIR
+
+TABLE_PATH = Path(__file__).with_name("departments.csv")
+GEOJSON_PATH = DATA_DIR / "departements.geojson"
+GEOJSON_URL = (
+    "https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/"
+    "departements-version-simplifiee.geojson"
+)
+
+
+@lru_cache(maxsize=1)
+def table():
+    """All departments: ``code``, ``name``, ``lat``, ``lon``, ``overseas``."""
+    df = pd.read_csv(TABLE_PATH, dtype={"code": "string", "name": "string"})
+    df["overseas"] = df["overseas"].astype(bool)
+    return df
+
+
+def normalise_code(code):
+    """Current department code of ``code`` as written in any annual release.
+
+    Releases up to 2018 write three characters ('590' for Nord, '201'/'202'
+    for Corsica, '971' for Guadeloupe); later ones use '59', '2A' and '971'.
+    Single digits lose their leading zero when files go through a spreadsheet.
+    """
+    if code is None or pd.isna(code):
+        return pd.NA
+    code = str(code).strip().upper()
+    if code in ("201", "202"):
+        return "2A" if code == "201" else "2B"
+    if len(code) == 3 and code.endswith("0") and not code.startswith(("97", "98")):
+        return code[:2]
+    if len(code) == 1 and code.isdigit():
+        return "0" + code
+    return code
+
+
+def normalise(codes):
+    """Vectorised :func:`normalise_code` over a Series (each distinct code is mapped once)."""
+    codes = codes.astype("category")
+    mapping = {c: normalise_code(c) for c in codes.cat.categories}
+    return codes.map(mapping).astype("category")
+
+
+def with_counts(counts, code_column="dep"):
+    """Join per-department ``count`` to the reference table in one merge.
+
+    ``counts`` may hold raw codes (several rows per department); they are
+    normalised and summed first. Departments without any count get 0, and
+    codes missing from the table are kept with no name or centroid.
+    """
+    codes = normalise(counts[code_column]).astype("string")
+    totals = counts["count"].groupby(codes.to_numpy(), dropna=True).sum().rename_axis("code").reset_index()
+    totals["code"] = totals["code"].astype("string")
+    merged = table().merge(totals, on="code", how="outer")
+    merged["count"] = merged["count"].fillna(0).astype("int64")
+    return merged
+
+
+def geojson():
+    """Department boundaries if :data:`GEOJSON_PATH` exists, else None."""
+    if not GEOJSON_PATH.exists():
+        return None
+    # Read again once downloaded or replaced while the server runs.
+    return _read_geojson(GEOJSON_PATH, GEOJSON_PATH.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=1)
+def _read_geojson(path, mtime):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def fetch_geojson(url=GEOJSON_URL, path=GEOJSON_PATH):
+    """Download the department boundaries at ``url`` to ``path``. Returns the number of departments.
+
+    Only the ``code`` and ``name`` of each feature are kept. The file is
+    replaced atomically, and only if every feature has a ``code``.
+    """
+    with urllib.request.urlopen(url, timeout=60) as response:
+        boundaries = json.load(response)
+    features = []
+    for feature in boundaries["features"]:
+        properties = feature.get("properties") or {}
+        if not properties.get("code"):
+            raise ValueError(f"{url}: a department has no code")
+        name = properties.get("name", properties.get("nom"))
+        features.append({**feature, "properties": {"code": str(properties["code"]), "name": name}})
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return len(features)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download the department boundaries drawn by the choropleths.")
+    parser.add_argument("--url", default=GEOJSON_URL)
+    parser.add_argument("--out", type=Path, default=GEOJSON_PATH)
+    args = parser.parse_args(argv)
+
+    count = fetch_geojson(args.url, args.out)
+    print(f"Wrote {args.out} ({count} departments)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""Build the merged per-year dataset from the raw ONISR files.
+
+This is the scripted version of the merge in ``app.ipynb``::
+
+    python -m roadsafety.etl 2024
+
+It reads ``caract``, ``lieux``, ``usagers`` and ``vehicules`` for one year,
+inner-joins them on ``Num_Acc`` (so each user row is repeated for every
+vehicle of its accident, as in the notebook), median-fills ``an_nais`` and
+``occutc``, drops rows without ``adr``/``voie``, derives ``age`` and the
+columns of :data:`roadsafety.store.DERIVED_COLUMNS` (date, hour, weekday, age
+group) and writes
+``data/dataset/an=<year>/part-0.parquet``. The raw tables are also written,
+cleaned the same way but not joined, as the normalised tables of
+:mod:`roadsafety.schema` (``data/tables/<table>/an=<year>/``): they keep the
+accidents, vehicles and users the inner join drops.
+
+Only the per-accident and per-vehicle tables are held in memory, indexed and
+sorted by ``Num_Acc``. Users are streamed in chunks of ``chunksize`` rows and
+each chunk is joined and written, along with its rows of the users table,
+before the next one is read, so neither the users of the year nor the
+users x vehicles fan-out are ever held at once.
+
+Several years are built in parallel, one per worker process
+(:mod:`roadsafety.parallel`, ``--workers``).
+"""
+
+import argparse
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from roadsafety import parallel, schema
+from roadsafety.store import COORD_COLUMNS, DATA_DIR, DATASET_DIR, derived_columns
+
+RAW_DIR = DATA_DIR
+
+# File names used by the annual releases (the 2022 one really is misspelled).
+SOURCE_FILES = {
+    "caract": ["caract-{year}.csv", "caracteristiques-{year}.csv", "carcteristiques-{year}.csv"],
+    "lieux": ["lieux-{year}.csv"],
+    "usagers": ["usagers-{year}.csv"],
+    "vehicules": ["vehicules-{year}.csv"],
+}
+
+# Explicit dtypes of the raw columns. Integers are nullable because older
+# releases leave some codes empty instead of using -1.
+SOURCE_DTYPES = {
+    "caract": {
+        "Num_Acc": "int64", "jour": "Int8", "mois": "Int8", "an": "Int16",
+        "hrmn": "string", "lum": "Int8", "dep": "string", "com": "string",
+        "agg": "Int8", "int": "Int8", "atm": "Int8", "col": "Int8",
+        "adr": "string", "lat": "string", "long": "string",
+    },
+    "lieux": {
+        "Num_Acc": "int64", "catr": "Int8", "voie": "string", "v1": "Int8",
+        "v2": "string", "circ": "Int8", "nbv": "string", "vosp": "Int8",
+        "prof": "Int8", "pr": "string", "pr1": "string", "plan": "Int8",
+        "lartpc": "string", "larrout": "string", "surf": "Int8", "infra": "Int8",
+        "situ": "Int8", "vma": "Int16",
+    },
+    "usagers": {
+        "Num_Acc": "int64", "id_usager": "string", "id_vehicule": "string",
+        "num_veh": "string", "place": "Int8", "catu": "Int8", "grav": "Int8",
+        "sexe": "Int8", "an_nais": "float64", "trajet": "Int8", "secu1": "Int8",
+        "secu2": "Int8", "secu3": "Int8", "locp": "Int8", "actp": "string",
+        "etatp": "Int8",
+    },
+    "vehicules": {
+        "Num_Acc": "int64", "id_vehicule": "string", "num_veh": "string",
+        "senc": "Int8", "catv": "Int8", "obs": "Int8", "obsm": "Int8",
+        "choc": "Int8", "manv": "Int8", "motor": "Int8", "occutc": "float64",
+    },
+}
+
+# Columns the notebook dropped before writing df_dataset.csv.
+DROPPED_COLUMNS = {
+    "lieux": ["lartpc"],
+    "vehicules": ["id_vehicule"],
+}
+
+MEDIAN_FILLED = ["an_nais", "occutc"]
+REQUIRED_COLUMNS = ["adr", "voie"]
+
+DEFAULT_CHUNKSIZE = 50_000
+
+
+def _output_columns():
+    """Column order of df_dataset.csv."""
+    caract = list(SOURCE_DTYPES["caract"])
+    lieux = [c for c in SOURCE_DTYPES["lieux"] if c != "Num_Acc" and c not in DROPPED_COLUMNS["lieux"]]
+    usagers = [
+        "num_veh_x" if c == "num_veh" else c
+        for c in SOURCE_DTYPES["usagers"] if c not in ("Num_Acc", "an_nais")
+    ]
+    vehicules = [
+        "num_veh_y" if c == "num_veh" else c
+        for c in SOURCE_DTYPES["vehicules"] if c != "Num_Acc" and c not in DROPPED_COLUMNS["vehicules"]
+    ]
+    return caract + lieux + usagers + vehicules + ["age"]
+
+
+OUTPUT_COLUMNS = _output_columns()
+
+
+class StageReport:
+    """Wall time and peak traced memory of each pipeline stage.
+
+    Tracing memory slows pandas down noticeably; pass ``trace_memory=False``
+    to only record timings.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        started = self.trace_memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        info = {"stage": name, "rows": None, "peak_mb": None}
+        try:
+            yield info
+        finally:
+            info["seconds"] = time.perf_counter() - t0
+            if self.trace_memory:
+                info["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+            self.stages.append(info)
+            if started:
+                tracemalloc.stop()
+
+    def summary(self):
+        lines = [f"{'stage':<32}{'rows':>12}{'seconds':>10}{'rows/s':>12}{'peak MB':>10}"]
+        for s in self.stages:
+            rows = f"{s['rows']:,}" if s["rows"] is not None else ""
+            rate = f"{s['rows'] / s['seconds']:,.0f}" if s["rows"] and s["seconds"] > 0 else ""
+            peak = f"{s['peak_mb']:.1f}" if s["peak_mb"] is not None else "-"
+            lines.append(f"{s['stage']:<32}{rows:>12}{s['seconds']:>10.3f}{rate:>12}{peak:>10}")
+        return "\n".join(lines)
+
+
+def source_path(kind, year, raw_dir=RAW_DIR):
+    """Locate the raw file of ``kind`` for ``year``."""
+    for pattern in SOURCE_FILES[kind]:
+        path = Path(raw_dir) / pattern.format(year=year)
+        if path.exists():
+            return path
+    raise FileNotFoundError(f"No {kind} file for {year} in {raw_dir}")
+
+
+def _sniff(path):
+    """Delimiter and encoding of a raw file (the series is not consistent)."""
+    with open(path, "rb") as f:
+        head = f.read(1 << 16)
+    try:
+        head[:-4].decode("utf-8")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+    first_line = head.split(b"\n", 1)[0]
+    delimiter = ";" if first_line.count(b";") > first_line.count(b",") else ","
+    return delimiter, encoding
+
+
+def read_source(kind, path, columns=None, chunksize=None):
+    """Read a raw file with explicit dtypes, optionally as an iterator of chunks."""
+    delimiter, encoding = _sniff(path)
+    raw_names = pd.read_csv(path, sep=delimiter, encoding=encoding, nrows=0).columns
+    # Headers carry stray quotes and line endings (e.g. 'id_vehicule\n').
+    names = [str(n).strip().strip('"').strip() for n in raw_names]
+    dtypes = {n: t for n, t in SOURCE_DTYPES[kind].items() if n in names}
+    usecols = [n for n in names if n in dtypes and (columns is None or n in columns)]
+    return pd.read_csv(
+        path, sep=delimiter, encoding=encoding, header=0, names=names,
+        usecols=usecols, dtype=dtypes, on_bad_lines="skip", chunksize=chunksize,
+    )
+
+
+def _read_all(kind, path, chunksize, columns=None):
+    return pd.concat(read_source(kind, path, columns, chunksize), ignore_index=True)
+
+
+def _weighted_median(values, weights):
+    """Median of ``values`` repeated ``weights`` times, ignoring NaN."""
+    values = np.asarray(values, dtype="float64")
+    weights = np.asarray(weights, dtype="int64")
+    keep = ~np.isnan(values) & (weights > 0)
+    values, weights = values[keep], weights[keep]
+    if not len(values):
+        return np.nan
+    order = np.argsort(values, kind="stable")
+    values, cum = values[order], np.cumsum(weights[order])
+    total = cum[-1]
+    lo = values[np.searchsorted(cum, (total - 1) // 2, side="right")]
+    hi = values[np.searchsorted(cum, total // 2, side="right")]
+    return (lo + hi) / 2
+
+
+def _fill_values(accidents, vehicles, user_keys, user_an_nais):
+    """Medians of ``an_nais`` and ``occutc`` over the joined rows.
+
+    The notebook computed them after the join, so every user counts once per
+    vehicle of its accident and every vehicle once per user. Reproducing that
+    from per-accident counts avoids materialising the join.
+    """
+    acc_count = accidents.index.value_counts()
+    users_per_acc = pd.Series(user_keys).value_counts()
+    veh_per_acc = vehicles.index.value_counts()
+
+    user_weight = pd.Series(user_keys).map(acc_count * veh_per_acc).fillna(0)
+    veh_weight = vehicles.index.map(acc_count * users_per_acc).fillna(0)
+    return {
+        "an_nais": _weighted_median(user_an_nais, user_weight),
+        "occutc": _weighted_median(vehicles["occutc"], veh_weight),
+    }
+
+
+def _parse_coordinates(df):
+    for col in COORD_COLUMNS:
+        coords = df[col].str.replace(",", ".", regex=False)
+        df[col] = pd.to_numeric(coords, errors="coerce").astype("float64")
+
+
+def _finish_batch(batch, year, fill_values):
+    for col in MEDIAN_FILLED:
+        batch[col] = batch[col].fillna(fill_values[col])
+    batch["an"] = batch["an"].fillna(year)
+    batch["age"] = batch["an"].astype("float64") - batch["an_nais"]
+    _parse_coordinates(batch)
+    batch = batch.dropna(subset=REQUIRED_COLUMNS)
+    # Columns missing from older releases are added empty so every
+    # partition shares the same schema.
+    return batch.reindex(columns=OUTPUT_COLUMNS)
+
+
+def _kept_accidents(accidents, year):
+    """Accidents of ``year`` cleaned as the merged rows (coordinates parsed,
+    derived columns), without those lacking ``adr``/``voie``."""
+    accidents = accidents.reset_index()
+    accidents["an"] = accidents["an"].fillna(year)
+    _parse_coordinates(accidents)
+    accidents = accidents.dropna(subset=REQUIRED_COLUMNS)
+    return accidents.assign(**derived_columns(accidents))
+
+
+def _table(name, rows, year):
+    # The columns of table ``name`` held by ``rows``.
+    columns = [c for c in schema.TABLES[name] if c in rows.columns]
+    return rows[columns].assign(an=np.int16(year)).reset_index(drop=True)
+
+
+def _users_table(users, kept, year, fill_values):
+    """Rows of the users table of the raw ``users`` of the ``kept`` accidents."""
+    users = users[users["Num_Acc"].isin(kept)]
+    users = users.assign(age=float(year) - users["an_nais"].fillna(fill_values["an_nais"]))
+    return _table("users", users.assign(**derived_columns(users[["age"]])), year)
+
+
+def _tables(accidents, vehicles, year, fill_values):
+    """The accident, place and vehicle tables of :mod:`roadsafety.schema`.
+
+    ``accidents`` are the :func:`_kept_accidents`; the vehicles of the
+    others are dropped, but each vehicle is kept even if the join would
+    drop it. The users table is written as it is streamed, see :func:`_users_table`.
+    """
+    vehicles = vehicles[vehicles["Num_Acc"].isin(accidents["Num_Acc"])]
+    vehicles = vehicles.assign(occutc=vehicles["occutc"].fillna(fill_values["occutc"]))
+    frames = {"accidents": accidents, "places": accidents, "vehicles": vehicles}
+    return {name: _table(name, rows, year) for name, rows in frames.items()}
+
+
+def build_year(year, raw_dir=RAW_DIR, out_dir=DATASET_DIR, chunksize=DEFAULT_CHUNKSIZE,
+               csv_path=None, report=None, tables_dir=schema.TABLES_DIR):
+    """Merge one annual release into ``out_dir/an=<year>/part-0.parquet``.
+
+    Returns the number of rows written. If ``csv_path`` is given the merged
+    rows are also written there in the df_dataset.csv layout. The tables of
+    :mod:`roadsafety.schema` are written to ``tables_dir`` (None to skip them).
+    """
+    report = report or StageReport()
+
+    with report.stage("read caract+lieux") as info:
+        caract = _read_all("caract", source_path("caract", year, raw_dir), chunksize)
+        lieux = _read_all("lieux", source_path("lieux", year, raw_dir), chunksize)
+        lieux = lieux.drop(columns=DROPPED_COLUMNS["lieux"], errors="ignore")
+        accidents = caract.merge(lieux, on="Num_Acc", how="inner")
+        accidents = accidents.set_index("Num_Acc").sort_index()
+        info["rows"] = len(accidents)
+
+    with report.stage("read vehicules") as info:
+        raw_vehicles = _read_all("vehicules", source_path("vehicules", year, raw_dir), chunksize)
+        vehicles = raw_vehicles.drop(columns=DROPPED_COLUMNS["vehicules"], errors="ignore")
+        vehicles = vehicles.rename(columns={"num_veh": "num_veh_y"})
+        vehicles = vehicles.set_index("Num_Acc").sort_index()
+        info["rows"] = len(vehicles)
+
+    users_path = source_path("usagers", year, raw_dir)
+    with report.stage("median fill values") as info:
+        keys = _read_all("usagers", users_path, chunksize, columns=["Num_Acc", "an_nais"])
+        fill_values = _fill_values(accidents, vehicles, keys["Num_Acc"].to_numpy(), keys["an_nais"].to_numpy())
+        info["rows"] = len(keys)
+        del keys
+
+    partition = Path(out_dir) / f"an={year}"
+    partition.mkdir(parents=True, exist_ok=True)
+    tmp_path = partition / "part-0.parquet.tmp"
+    writer = None
+    written = 0
+    users_written = 0
+    with report.stage("join + write") as info, ExitStack() as stack:
+        if tables_dir is not None:
+            # The users table is written chunk by chunk along the join.
+            kept = _kept_accidents(accidents, year)
+            write_users = stack.enter_context(schema.table_writer("users", year, tables_dir))
+        try:
+            for users in read_source("usagers", users_path, chunksize=chunksize):
+                if tables_dir is not None:
+                    table = _users_table(users, kept["Num_Acc"], year, fill_values)
+                    write_users(table)
+                    users_written += len(table)
+                users = users.rename(columns={"num_veh": "num_veh_x"})
+                batch = (
+                    users.merge(accidents, left_on="Num_Acc", right_index=True, how="inner")
+                    .merge(vehicles, left_on="Num_Acc", right_index=True, how="inner")
+                )
+                batch = _finish_batch(batch, year, fill_values)
+                # The partitions also carry the derived columns computed
+                # once here; the CSV keeps the df_dataset.csv layout.
+                batch = batch.assign(**derived_columns(batch))
+                table = pa.Table.from_pandas(batch, preserve_index=False,
+                                             schema=writer.schema if writer else None)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression="zstd")
+                writer.write_table(table)
+                if csv_path is not None:
+                    batch[OUTPUT_COLUMNS].to_csv(csv_path, mode="w" if written == 0 else "a",
+                                                 header=written == 0, index=False)
+                written += len(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            raise ValueError(f"No rows joined for {year}")
+        info["rows"] = written
+
+    tmp_path.replace(partition / "part-0.parquet")
+
+    if tables_dir is not None:
+        with report.stage("write tables") as info:
+            sizes = schema.write_tables(_tables(kept, raw_vehicles, year, fill_values), year, tables_dir)
+            info["rows"] = sum(sizes.values()) + users_written
+    return written
+
+
+def _build_year_report(year, raw_dir, out_dir, chunksize, trace_memory, tables_dir):
+    report = StageReport(trace_memory=trace_memory)
+    rows = build_year(year, raw_dir, out_dir, chunksize, report=report, tables_dir=tables_dir)
+    return rows, report
+
+
+def build_years(years, raw_dir=RAW_DIR, out_dir=DATASET_DIR, chunksize=DEFAULT_CHUNKSIZE,
+                trace_memory=True, tables_dir=schema.TABLES_DIR, workers=None):
+    """:func:`build_year` of every year of ``years``, one year per worker process.
+
+    Returns [(year, rows written, :class:`StageReport`)]. Peak memory is per worker.
+    """
+    results = parallel.map_years(_build_year_report, years, raw_dir, out_dir, chunksize, trace_memory,
+                                 tables_dir, workers=workers)
+    return [(year, rows, report) for year, (rows, report) in results]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge the raw ONISR files of one or more years.")
+    parser.add_argument("years", type=int, nargs="+")
+    parser.add_argument("--raw-dir", type=Path, default=RAW_DIR, help="directory of the raw CSV files")
+    parser.add_argument("--out-dir", type=Path, default=DATASET_DIR, help="partitioned Parquet output")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="users joined per batch; bounds peak memory")
+    parser.add_argument("--csv", type=Path, help="also write the merged rows as a df_dataset.csv-style file")
+    parser.add_argument("--tables-dir", type=Path, default=schema.TABLES_DIR,
+                        help="normalised accident/place/vehicle/user tables output")
+    parser.add_argument("--no-memory", action="store_true", help="skip peak memory tracing (faster)")
+    parser.add_argument("--workers", type=int,
+                        help=f"years built in parallel (default: {parallel.WORKERS}); each holds its own year")
+    args = parser.parse_args(argv)
+
+    if args.csv is not None and len(args.years) > 1:
+        parser.error("--csv takes a single year")
+    if args.csv is not None:
+        report = StageReport(trace_memory=not args.no_memory)
+        rows = build_year(args.years[0], args.raw_dir, args.out_dir, args.chunksize, args.csv, report,
+                          args.tables_dir)
+        built = [(args.years[0], rows, report)]
+    else:
+        built = build_years(args.years, args.raw_dir, args.out_dir, args.chunksize, not args.no_memory,
+                            args.tables_dir, args.workers)
+    for year, rows, report in built:
+        print(f"{year}: {rows:,} rows")
+        print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Cache of the serialised Plotly figures of the dashboard.
+
+Building a figure with plotly express (validation, templating, one trace per
+colour) often costs more than computing the counts it shows, and every rerun
+of a page rebuilds all of them. :class:`FigureCache` keeps the JSON of the
+figures already built, keyed by chart id, inputs and data version, so going
+back to a page or to a previous filter combination only parses that JSON.
+
+The cache is a bounded LRU: at most ``max_entries`` figures and
+``max_bytes`` of JSON are kept, the least recently used going first.
+"""
+
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+from roadsafety import perf
+
+# Default bounds of a FigureCache.
+MAX_FIGURES = 256
+MAX_BYTES = 64 * 2**20
+
+
+class FigureCache:
+    """LRU cache of figures as JSON, bounded in entries and bytes. Thread-safe."""
+
+    def __init__(self, max_entries=MAX_FIGURES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def get(self, key):
+        """JSON of the figure cached under ``key``, or None."""
+        with self._lock:
+            spec = self._figures.get(key)
+            if spec is None:
+                self.misses += 1
+                return None
+            self._figures.move_to_end(key)
+            self.hits += 1
+            return spec
+
+    def put(self, key, figure):
+        """Cache ``figure`` under ``key`` and return its JSON.
+
+        A figure larger than the whole byte budget is not kept.
+        """
+        spec = pio.to_json(figure, validate=False)
+        size = len(spec)
+        with self._lock:
+            if key in self._figures:
+                self.bytes -= len(self._figures.pop(key))
+            if size <= self.max_bytes:
+                self._figures[key] = spec
+                self.bytes += size
+            while len(self._figures) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self._figures.popitem(last=False)
+                self.bytes -= len(evicted)
+        return spec
+
+    def figure(self, key, build):
+        """Figure cached under ``key``, built by calling ``build()`` on a miss.
+
+        The size of its JSON and a miss are recorded in the current
+        :mod:`roadsafety.perf` section.
+        """
+        spec = self.get(key)
+        if spec is not None:
+            perf.payload(len(spec))
+            return pio.from_json(spec)
+        perf.missed()
+        figure = build()
+        perf.payload(len(self.put(key, figure)))
+        return figure
+
+    def discard(self, stale):
+        """Drop the figures whose key ``stale(key)`` is true. Returns how many were dropped."""
+        with self._lock:
+            keys = [key for key in self._figures if stale(key)]
+            for key in keys:
+                self.bytes -= len(self._figures.pop(key))
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self.bytes = 0
@@ -0,0 +1,83 @@
+"""Cross-filters shared by the dashboard pages.
+
+Besides the years, the sidebar restricts every chart to some departments,
+severities, age groups, vehicle categories, light and weather conditions
+(:data:`FILTERS`). A filter state is a tuple of ``(column, values)`` pairs,
+one per filtered column, in :data:`FILTERS` order, so equal states are equal
+cache keys whatever order the filters were set in. Values are what the
+loaded columns hold: labels for the coded columns (see
+:mod:`roadsafety.labels`), department codes and age groups.
+
+The selected rows themselves are resolved by :mod:`roadsafety.data`, which
+caches one mask per filtered column and combines them.
+"""
+
+import numpy as np
+
+from roadsafety import labels, store
+
+# Filtered columns and their sidebar titles, in display order.
+FILTERS = {
+    "dep": "Department",
+    "grav": "Severity",
+    "tranche_age": "Age group",
+    "catv": "Vehicle category",
+    "lum": "Light",
+    "atm": "Weather",
+}
+
+NO_FILTERS = ()
+
+
+def options(column):
+    """Values offered for ``column`` (departments are listed from the data)."""
+    if column in labels.LABELS:
+        return list(labels.dtype(column).categories)
+    if column == "tranche_age":
+        return list(store.AGE_LABELS)
+    raise ValueError(f"No fixed options for {column!r}")
+
+
+def make(selection):
+    """Filter state of ``selection``, a mapping of column -> selected values.
+
+    Columns with nothing selected are not filtered.
+    """
+    return tuple(
+        (column, tuple(sorted(selection[column], key=str)))
+        for column in FILTERS if selection.get(column)
+    )
+
+
+def columns(filters):
+    """Filtered columns of ``filters``."""
+    return [column for column, _ in filters]
+
+
+def restrict(filters, column, values):
+    """``filters`` further restricted to ``values`` of ``column``.
+
+    If ``column`` is already filtered, only the values selected in both are
+    kept, possibly none (then no row is kept).
+    """
+    selection = dict(filters)
+    if column in selection:
+        values = [v for v in values if v in selection[column]]
+    selection[column] = tuple(sorted(values, key=str))
+    return tuple((c, selection[c]) for c in FILTERS if c in selection)
+
+
+def where(filters):
+    """``filters`` as a cube ``where`` (codes instead of labels)."""
+    return {
+        column: labels.codes_of(column, values) if column in labels.LABELS else list(values)
+        for column, values in filters
+    }
+
+
+def mask(df, filters):
+    """Boolean array of the rows of ``df`` kept by ``filters``."""
+    keep = np.ones(len(df), dtype=bool)
+    for column, values in filters:
+        keep &= df[column].isin(values).to_numpy()
+    return keep
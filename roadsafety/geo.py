@@ -0,0 +1,175 @@
+"""Geographic helpers for the accident maps.
+
+Maps never ship every accident to the browser. Accidents are counted on
+square lat/long grids of several resolutions (:data:`GRID_SIZES`, built once
+as cuboids of the cube) and a view draws the finest grid that keeps it under
+:data:`MAX_CELLS` cells. Individual accidents are only drawn when a view holds
+at most :data:`MAX_POINTS` of them; those are fetched through a
+:class:`GridIndex` built once over the loaded rows instead of scanning them.
+"""
+
+import math
+
+import numpy as np
+
+# Grid resolutions in degrees, coarsest first (level 0 = 0.25 deg, ~25 km).
+GRID_SIZES = [0.25, 0.1, 0.05, 0.02, 0.01]
+
+# Upper bounds of what a map sends to the browser.
+MAX_CELLS = 4000
+MAX_POINTS = 5000
+
+# Map views as (lat_min, lat_max, lon_min, lon_max).
+AREAS = {
+    "Metropolitan France": (41.0, 51.5, -5.5, 10.0),
+    "Île-de-France": (48.1, 49.25, 1.4, 3.6),
+    "Paris": (48.80, 48.92, 2.22, 2.47),
+    "Lyon": (45.65, 45.85, 4.70, 5.00),
+    "Marseille": (43.17, 43.42, 5.20, 5.58),
+    "Bordeaux": (44.75, 44.95, -0.70, -0.45),
+    "Corsica": (41.3, 43.1, 8.5, 9.6),
+    "Guadeloupe": (15.8, 16.55, -61.85, -61.0),
+    "Martinique": (14.35, 14.9, -61.25, -60.8),
+    "French Guiana": (2.1, 5.8, -54.6, -51.6),
+    "Réunion": (-21.4, -20.85, 55.2, 55.85),
+    "Mayotte": (-13.05, -12.6, 45.0, 45.3),
+}
+
+
+def cell_column(axis, level):
+    """Name of the cell index column of ``axis`` ('lat' or 'lon') at ``level``."""
+    return f"g{axis}_{level}"
+
+
+def cell_columns(level):
+    """Cell index columns (lat, lon) of grid ``level``."""
+    return cell_column("lat", level), cell_column("lon", level)
+
+
+def cell_index(values, size):
+    """Index of the grid cell of each coordinate (NA for missing coordinates)."""
+    return np.floor(values / size).astype("Int32")
+
+
+def grid_level(bbox):
+    """Finest grid level keeping ``bbox`` under :data:`MAX_CELLS` cells."""
+    lat_min, lat_max, lon_min, lon_max = bbox
+    for level in reversed(range(len(GRID_SIZES))):
+        size = GRID_SIZES[level]
+        cells = math.ceil((lat_max - lat_min) / size) * math.ceil((lon_max - lon_min) / size)
+        if cells <= MAX_CELLS:
+            return level
+    return 0
+
+
+def cells_in_bbox(cells, level, bbox):
+    """Keep the cells of ``level`` whose centre lies in ``bbox`` and add the centres."""
+    size = GRID_SIZES[level]
+    lat = (cells[cell_column("lat", level)].astype("float64") + 0.5) * size
+    lon = (cells[cell_column("lon", level)].astype("float64") + 0.5) * size
+    lat_min, lat_max, lon_min, lon_max = bbox
+    inside = (lat.between(lat_min, lat_max) & lon.between(lon_min, lon_max)).to_numpy()
+    return cells[inside].assign(lat=lat[inside], long=lon[inside])
+
+
+def bbox_mask(lat, lon, bbox):
+    """Boolean mask of the coordinates inside ``bbox``."""
+    lat_min, lat_max, lon_min, lon_max = bbox
+    return (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+
+
+def view(bbox):
+    """Centre and Plotly zoom level showing ``bbox``."""
+    lat_min, lat_max, lon_min, lon_max = bbox
+    center = {"lat": (lat_min + lat_max) / 2, "lon": (lon_min + lon_max) / 2}
+    extent = max(lon_max - lon_min, (lat_max - lat_min) * 1.5)
+    zoom = max(0.0, min(15.0, math.log2(360 / extent) - 0.5))
+    return center, zoom
+
+
+def severity_cells(cells, level, gravs, labels):
+    """One row per cell with the total and a column per severity in ``gravs``."""
+    keys = list(cell_columns(level)) + ["lat", "long"]
+    wide = cells.pivot_table(index=keys, columns="grav", values="count", aggfunc="sum", fill_value=0)
+    wide = wide.reindex(columns=list(gravs), fill_value=0).rename(columns=labels)
+    wide.columns = [str(c) for c in wide.columns]
+    wide["count"] = wide.sum(axis=1)
+    return wide.reset_index()
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat, lon, lat0, lon0):
+    """Great-circle distance in km between each (lat, lon) and (lat0, lon0)."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lat0, lon0 = math.radians(lat0), math.radians(lon0)
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * math.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class GridIndex:
+    """Bucket index of coordinates on a regular lat/long grid.
+
+    Rows are sorted by cell once; a query then only looks at the rows of the
+    cells overlapping its bounding box. The grid covers the whole globe, so
+    overseas departments are indexed like metropolitan France. Rows without
+    valid coordinates are left out. Queries return positions into the arrays
+    the index was built from (use them with ``DataFrame.iloc``).
+    """
+
+    # Cell keys are lat_cell * _WIDTH + lon_cell, both shifted to be >= 0.
+    _WIDTH = 1 << 20
+
+    def __init__(self, lat, lon, cell_size=0.05):
+        self.cell_size = cell_size
+        self.lat = np.asarray(lat, dtype="float64")
+        self.lon = np.asarray(lon, dtype="float64")
+        valid = np.flatnonzero(
+            np.isfinite(self.lat) & np.isfinite(self.lon) & (np.abs(self.lat) <= 90) & (np.abs(self.lon) <= 180)
+        )
+        keys = self._keys(self.lat[valid], self.lon[valid])
+        order = np.argsort(keys, kind="stable")
+        # Positions of the indexed rows, grouped by cell.
+        self.order = valid[order].astype(np.int64 if len(self.lat) >= 2**31 else np.int32)
+        self.cells, starts = np.unique(keys[order], return_index=True)
+        self.starts = np.append(starts, len(order))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _cell(self, values):
+        return np.floor(np.asarray(values) / self.cell_size).astype(np.int64)
+
+    def _keys(self, lat, lon):
+        offset = self._WIDTH // 2
+        return (self._cell(lat) + offset) * self._WIDTH + (self._cell(lon) + offset)
+
+    def _candidates(self, bbox):
+        """Positions of the rows in the cells overlapping ``bbox``."""
+        lat_min, lat_max, lon_min, lon_max = bbox
+        lon_lo, lon_hi = self._keys(0, [lon_min, lon_max]) - self._keys(0, 0)
+        slices = []
+        for row in range(self._cell(lat_min), self._cell(lat_max) + 1):
+            base = self._keys(row * self.cell_size + self.cell_size / 2, 0)
+            lo, hi = np.searchsorted(self.cells, [base + lon_lo, base + lon_hi + 1])
+            if hi > lo:
+                slices.append(self.order[self.starts[lo]:self.starts[hi]])
+        return np.concatenate(slices) if slices else np.empty(0, dtype=self.order.dtype)
+
+    def viewport(self, bbox):
+        """Sorted positions of the rows inside ``bbox`` (lat_min, lat_max, lon_min, lon_max)."""
+        rows = self._candidates(bbox)
+        rows = rows[bbox_mask(self.lat[rows], self.lon[rows], bbox)]
+        return np.sort(rows)
+
+    def radius(self, lat, lon, km):
+        """Positions of the rows within ``km`` of (lat, lon), nearest first, and their distances."""
+        dlat = math.degrees(km / EARTH_RADIUS_KM)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        rows = self._candidates((lat - dlat, lat + dlat, lon - dlon, lon + dlon))
+        dist = haversine_km(self.lat[rows], self.lon[rows], lat, lon)
+        keep = dist <= km
+        rows, dist = rows[keep], dist[keep]
+        nearest = np.argsort(dist, kind="stable")
+        return rows[nearest], dist[nearest]
@@ -0,0 +1,96 @@
+"""Incremental ingest of new annual releases.
+
+When ONISR publishes a year, only that year has to be processed::
+
+    python -m roadsafety.ingest 2025
+
+The raw files of the year (``caract``, ``lieux``, ``usagers``, ``vehicules``)
+are merged into a new partition of the dataset and of the normalised tables
+(:mod:`roadsafety.etl`); the other partitions are not read. Then only that
+year's delta is merged into the precomputed data: its cuboids are built
+(the cube is partitioned by year, so the others stay as they are) and its
+rows are merged into the memory-mapped dataset, if it was built
+(:func:`roadsafety.shared.update`). An already ingested year is replaced the
+same way, e.g. after a corrected release.
+
+Each ingest appends the resulting data version (:func:`roadsafety.schema.data_version`,
+overall and per year) to ``data/versions.jsonl``.
+"""
+
+import argparse
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from roadsafety import cube, etl, parallel, schema, shared, store
+from roadsafety.etl import StageReport
+
+VERSIONS_PATH = store.DATA_DIR / "versions.jsonl"
+
+
+def record_version(ingested, dataset=None, tables_dir=schema.TABLES_DIR, path=VERSIONS_PATH):
+    """Append the current data version to ``path`` after ingesting ``ingested`` {year: rows}.
+
+    Returns the recorded entry.
+    """
+    dataset = dataset or store.open_dataset()
+    entry = {
+        "version": schema.data_version(dataset, tables_dir),
+        "years": {str(y): schema.data_version(dataset, tables_dir, [y]) for y in store.available_years(dataset)},
+        "ingested": {str(y): rows for y, rows in ingested.items()},
+        "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def versions(path=VERSIONS_PATH):
+    """Recorded versions, oldest first."""
+    if not Path(path).exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def ingest(years, raw_dir=etl.RAW_DIR, dataset_dir=store.DATASET_DIR, tables_dir=schema.TABLES_DIR,
+           cube_dir=cube.CUBE_DIR, shared_path=shared.SHARED_PATH, chunksize=etl.DEFAULT_CHUNKSIZE,
+           workers=None, report=None):
+    """Add (or replace) ``years`` from their raw files, updating only their share of the data.
+
+    Returns (the recorded version entry, [(year, rows, ETL report)]).
+    """
+    report = report or StageReport(trace_memory=False)
+    built = etl.build_years(years, raw_dir, dataset_dir, chunksize, False, tables_dir, workers)
+    # Reopened to see the new partitions.
+    dataset = store.open_dataset(dataset_dir=dataset_dir)
+    with report.stage("cube (new years)") as info:
+        sizes = cube.build_cube(years, dataset, cube_dir, tables_dir, workers)
+        info["rows"] = sum(n for _, cells in sizes for n in cells.values())
+    with report.stage("shared dataset (merge)") as info:
+        info["rows"] = shared.update(years, dataset, tables_dir, shared_path)
+    entry = record_version({year: rows for year, rows, _ in built}, dataset, tables_dir,
+                           Path(dataset_dir).parent / VERSIONS_PATH.name)
+    return entry, built
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest new annual releases without rebuilding the others.")
+    parser.add_argument("years", type=int, nargs="+")
+    parser.add_argument("--raw-dir", type=Path, default=etl.RAW_DIR, help="directory of the raw CSV files")
+    parser.add_argument("--chunksize", type=int, default=etl.DEFAULT_CHUNKSIZE,
+                        help="users joined per batch; bounds peak memory")
+    parser.add_argument("--workers", type=int, help=f"years processed in parallel (default: {parallel.WORKERS})")
+    args = parser.parse_args(argv)
+
+    report = StageReport(trace_memory=False)
+    entry, built = ingest(args.years, args.raw_dir, chunksize=args.chunksize, workers=args.workers, report=report)
+    for year, rows, year_report in built:
+        print(f"{year}: {rows:,} rows")
+        print(year_report.summary())
+    print(report.summary())
+    print(f"Data version {entry['version']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Headline figures shown on the Global Overview page."""
+
+import numpy as np
+import pandas as pd
+
+from roadsafety import labels
+
+# grav codes (description-des-bases-de-donnees-annuelles.pdf).
+SEVERITY_CODES = {
+    "unharmed": 1,
+    "killed": 2,
+    "hospitalized": 3,
+    "minor": 4,
+}
+
+
+def severity_kpis(df, mask=None):
+    """Severity counts, row count and distinct accidents in one pass over ``grav``.
+
+    ``mask`` is an optional boolean array selecting the rows to count; it is
+    applied to the underlying arrays so no filtered frame is built. Rows are
+    victims (see :mod:`roadsafety.schema`), so ``rows`` is the number of
+    victims and ``accidents`` (distinct ``Num_Acc``) the number of accidents.
+    """
+    grav = df["grav"]
+    if isinstance(grav.dtype, pd.CategoricalDtype):
+        # Labelled column: count the category numbers instead of the codes.
+        slots = {name: labels.position("grav", code) for name, code in SEVERITY_CODES.items()}
+        grav = grav.cat.codes.to_numpy()
+    else:
+        slots = SEVERITY_CODES
+        grav = grav.to_numpy()
+    num_acc = df["Num_Acc"].to_numpy()
+    if mask is not None:
+        grav, num_acc = grav[mask], num_acc[mask]
+
+    counts = np.bincount(grav[grav >= 0].astype(np.intp), minlength=max(slots.values()) + 1)
+    kpis = {name: int(counts[slot]) for name, slot in slots.items()}
+    kpis["rows"] = int(len(grav))
+    kpis["accidents"] = int(len(pd.unique(num_acc)))
+    return kpis
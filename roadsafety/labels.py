@@ -0,0 +1,205 @@
+"""Labels of the coded columns, from description-des-bases-de-donnees-annuelles.pdf.
+
+The annual files store most characteristics as small integer codes. This
+module is the one place mapping them to English labels. :func:`categorical`
+turns a column of codes into a pandas Categorical whose categories are the
+labels (still one int8 code per row), so charts and value counts get their
+labels without any per-row ``.map()``.
+
+Codes missing from :data:`LABELS` become NaN, like an unmatched ``.map()``.
+Several codes may share a label (e.g. both "not specified" codes of
+``trajet``); they then fall in the same category.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+LABELS = {
+    # Users
+    "grav": {
+        1: "Unharmed",
+        2: "Killed",
+        3: "Hospitalized injured",
+        4: "Minor injuries",
+    },
+    "catu": {
+        1: "Driver",
+        2: "Passenger",
+        3: "Pedestrian",
+        4: "Pedestrian on rollerblades or scooter",  # before 2019
+    },
+    "place": {
+        1: "1. Front left (driver)",
+        2: "2. Front right",
+        3: "3. Rear right",
+        4: "4. Rear left",
+        5: "5. Rear center",
+        6: "6. Front middle",
+        7: "7. Left side passenger",
+        8: "8. Right side passenger",
+        9: "9. On the vehicle",
+        10: "10. Pedestrian (not applicable)",
+    },
+    "sexe": {
+        1: "Male",
+        2: "Female",
+    },
+    "trajet": {
+        -1: "Not specified",
+        0: "Not specified",
+        1: "Home - work",
+        2: "Home - school",
+        3: "Shopping - purchases",
+        4: "Professional use",
+        5: "Walk - leisure",
+        9: "Other",
+    },
+    # Vehicles
+    "catv": {
+        0: "Undeterminable",
+        1: "Bicycle",
+        2: "Moped <50cm3",
+        3: "Microcar",
+        4: "Registered scooter (SIV)",
+        5: "Motorcycle",
+        6: "Side-car",
+        7: "Light vehicle (GVWR <= 3.5T) alone",
+        8: "Light vehicle + caravan (unused since 2006)",
+        9: "Light vehicle + trailer (unused since 2006)",
+        10: "Utility vehicle alone (1.5T <= GVWR <= 3.5T)",
+        11: "Utility vehicle + caravan (unused since 2006)",
+        12: "Utility vehicle + trailer (unused since 2006)",
+        13: "Heavy goods vehicle alone 3.5T <GVWR <= 7.5T",
+        14: "Heavy goods vehicle alone > 7.5T",
+        15: "Heavy goods vehicle > 3.5T + trailer",
+        16: "Road tractor alone",
+        17: "Road tractor + semi-trailer",
+        18: "Public transport (unused since 2006)",
+        19: "Tramway (unused since 2006)",
+        20: "Special equipment",
+        21: "Agricultural tractor",
+        30: "Scooter < 50 cm3",
+        31: "Motorcycle > 50 cm3 and <= 125 cm3",
+        32: "Scooter > 50 cm3 and <= 125 cm3",
+        33: "Motorcycle > 125 cm3",
+        34: "Scooter > 125 cm3",
+        35: "Light quad <= 50 cm3",
+        36: "Heavy quad > 50 cm3",
+        37: "Bus",
+        38: "Coach",
+        39: "Train",
+        40: "Tram",
+        41: "Three-wheeler <= 50 cm3",
+        42: "Three-wheeler > 50 cm3 and <= 125 cm3",
+        43: "Three-wheeler > 125 cm3",
+        50: "Motorised personal transporter",
+        60: "Non-motorised personal transporter",
+        80: "Electric-assist bicycle",
+        99: "Other vehicle",
+    },
+    # Characteristics
+    "lum": {
+        1: "Full daylight",
+        2: "Twilight or dawn",
+        3: "Night without public lighting",
+        4: "Night with public lighting not lit",
+        5: "Night with public lighting lit",
+    },
+    "atm": {
+        -1: "Not specified",
+        1: "Normal",
+        2: "Light rain",
+        3: "Heavy rain",
+        4: "Snow - hail",
+        5: "Fog - smoke",
+        6: "Strong wind - storm",
+        7: "Dazzling weather",
+        8: "Overcast weather",
+        9: "Other",
+    },
+    # Places
+    "catr": {
+        1: "Highway",
+        2: "National road",
+        3: "Departmental road",
+        4: "Communal road",
+        5: "Outside public network",
+        6: "Parking lot",
+        7: "Urban metropolis road",
+        9: "Other",
+    },
+    "surf": {
+        -1: "Not specified",
+        1: "Normal",
+        2: "Wet",
+        3: "Puddles",
+        4: "Flooded",
+        5: "Snowy",
+        6: "Mud",
+        7: "Icy",
+        8: "Greasy - oil",
+        9: "Other",
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def dtype(column):
+    """Categorical dtype of ``column``: its distinct labels, in code order."""
+    return pd.CategoricalDtype(list(dict.fromkeys(LABELS[column].values())))
+
+
+def position(column, code):
+    """Category number (as in ``Series.cat.codes``) of ``code`` of ``column``."""
+    return dtype(column).categories.get_loc(LABELS[column][code])
+
+
+@lru_cache(maxsize=None)
+def _lookup(column):
+    # Category number of every int8 code (shifted by 128), -1 if unlabelled.
+    table = np.full(256, -1, dtype=np.int8)
+    for code in LABELS[column]:
+        table[code + 128] = position(column, code)
+    return table
+
+
+def categorical(codes, column):
+    """Labelled Categorical Series of the Series of ``codes`` of ``column``."""
+    if isinstance(codes.dtype, pd.CategoricalDtype):
+        return codes
+    values = pd.array(codes, dtype="Int16")
+    valid = (~values.isna() & (values >= -128) & (values <= 127)).to_numpy(dtype=bool)
+    shifted = values.to_numpy(dtype=np.int16, na_value=0) + 128
+    categories = np.where(valid, _lookup(column)[np.where(valid, shifted, 0)], -1)
+    values = pd.Categorical.from_codes(categories, dtype=dtype(column))
+    return pd.Series(values, index=codes.index, name=codes.name)
+
+
+def label(df):
+    """``df`` with every column of :data:`LABELS` it holds as labelled categoricals."""
+    return df.assign(**{c: categorical(df[c], c) for c in df.columns if c in LABELS})
+
+
+def codes_of(column, names):
+    """All the codes of ``column`` labelled with one of ``names``."""
+    names = set(names)
+    return [code for code, name in LABELS[column].items() if name in names]
+
+
+def codes(values, column):
+    """Codes (Int16) of a labelled Series of ``column``, the inverse of :func:`categorical`.
+
+    A label shared by several codes gives back the first of them.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    first = {}
+    for code, name in LABELS[column].items():
+        first.setdefault(name, code)
+    table = np.array([first[name] for name in values.cat.categories] + [0], dtype=np.int16)
+    positions = values.cat.codes.to_numpy()
+    result = pd.array(table[positions], dtype="Int16")
+    result[positions < 0] = pd.NA
+    return pd.Series(result, index=values.index, name=values.name)
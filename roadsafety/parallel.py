@@ -0,0 +1,54 @@
+"""Map-reduce over year partitions in a pool of worker processes.
+
+Every stored table is partitioned by year, and most of the work on them
+(merging a release, aggregating a cuboid) is independent from one year to
+the next. :func:`map_years` runs such a function for several years in
+parallel worker processes, and :func:`map_reduce` combines the per-year
+results, e.g. partial counts summed into one table::
+
+    cells = parallel.map_reduce(cube.aggregate_year, years, cube.combine, "catv")
+
+The number of workers defaults to :data:`WORKERS`, set by the
+``ROADSAFETY_WORKERS`` environment variable (all cores by default). With one
+worker or one year everything runs in the calling process, without a pool.
+Workers are started with ``spawn``, not forked: forking a process running
+threads (Arrow's, a server's) is unsafe. Functions and their arguments are
+pickled to the workers, so they must be defined at module level, and a
+script using a pool must guard its entry point with
+``if __name__ == "__main__"``, as the ``python -m roadsafety...`` commands do.
+
+This is meant for the command-line builds (ETL, cube, warm-up). The
+dashboard aggregates in its own process: a pool per cache miss, in every
+session, would oversubscribe the host.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+WORKERS = int(os.environ.get("ROADSAFETY_WORKERS") or os.cpu_count() or 1)
+
+
+def workers_for(tasks, workers=None):
+    """Number of worker processes to run ``tasks`` tasks with (at most one per task)."""
+    return max(1, min(workers or WORKERS, tasks))
+
+
+def map_years(fn, years, *args, workers=None, **kwargs):
+    """``[(year, fn(year, *args, **kwargs)) for year in years]``, years run in parallel.
+
+    Results come back in the order of ``years``. An exception raised for a
+    year is raised again here once the running years are done.
+    """
+    years = list(years)
+    n = workers_for(len(years), workers)
+    if n == 1:
+        return [(year, fn(year, *args, **kwargs)) for year in years]
+    with ProcessPoolExecutor(max_workers=n, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(fn, year, *args, **kwargs) for year in years]
+        return [(year, future.result()) for year, future in zip(years, futures)]
+
+
+def map_reduce(fn, years, combine, *args, workers=None, **kwargs):
+    """``combine`` of the list of results of ``fn`` for every year (see :func:`map_years`)."""
+    return combine([result for _, result in map_years(fn, years, *args, workers=workers, **kwargs)])
@@ -0,0 +1,120 @@
+"""Lightweight instrumentation of the dashboard reruns.
+
+Each page calls :func:`begin` first; every data access of
+:mod:`roadsafety.data` then runs in a :func:`section` recording its duration,
+the rows (or cube cells) it scanned and the bytes it sends to the browser
+(figure JSON, tables). A section that scanned nothing was answered from a
+cache, which gives the hit ratio of each function. :func:`end` closes the
+rerun and returns its breakdown, also appended as one JSON line to
+:data:`LOG_PATH` when set.
+
+Records are kept per thread: Streamlit runs each session's reruns in its
+own thread. Sections outside a rerun (e.g. the warm-up thread) only count
+in the process totals of :func:`totals`.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# JSON lines log of every rerun, if set.
+LOG_PATH = os.environ.get("ROADSAFETY_PERF_LOG")
+
+_local = threading.local()
+_lock = threading.Lock()
+_totals = {}
+
+
+def begin(page):
+    """Start recording a rerun of ``page``."""
+    _local.rerun = {"page": page, "started": time.time(), "sections": []}
+    _local.started = time.perf_counter()
+    _local.stack = []
+
+
+def current():
+    """Sections recorded so far in this thread's rerun (empty outside one)."""
+    rerun = getattr(_local, "rerun", None)
+    return rerun["sections"] if rerun else []
+
+
+@contextmanager
+def section(name):
+    """Time the enclosed block as section ``name`` of the current rerun."""
+    record = {"name": name, "seconds": 0.0, "rows": 0, "bytes": 0, "cached": True}
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        stack.pop()
+        if stack and not record["cached"]:
+            stack[-1]["cached"] = False
+        rerun = getattr(_local, "rerun", None)
+        if rerun is not None:
+            rerun["sections"].append(record)
+        with _lock:
+            total = _totals.setdefault(name, {"calls": 0, "hits": 0, "seconds": 0.0, "rows": 0})
+            total["calls"] += 1
+            total["hits"] += record["cached"]
+            total["seconds"] += record["seconds"]
+            total["rows"] += record["rows"]
+
+
+def timed(function):
+    """Decorator running each call of ``function`` in a :func:`section` of its name."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with section(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def scanned(rows):
+    """Record that the current section computed over ``rows`` rows (a cache miss)."""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1]["rows"] += int(rows)
+        stack[-1]["cached"] = False
+
+
+def missed():
+    """Record that the current section was not answered from a cache."""
+    scanned(0)
+
+
+def payload(size):
+    """Record ``size`` bytes sent to the browser by the current section."""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1]["bytes"] += int(size)
+
+
+def end():
+    """Close the current rerun and return it (None if :func:`begin` was not called).
+
+    The rerun has its ``page``, start time, total ``seconds`` and ``sections``.
+    """
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return None
+    _local.rerun = None
+    rerun["seconds"] = time.perf_counter() - _local.started
+    if LOG_PATH:
+        line = json.dumps(rerun, default=str)
+        with _lock, open(LOG_PATH, "a", encoding="utf-8") as log:
+            log.write(line + "\n")
+    return rerun
+
+
+def totals():
+    """Calls, cache hits, seconds and rows per section name since the process started."""
+    with _lock:
+        return {name: dict(total) for name, total in _totals.items()}
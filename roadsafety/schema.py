@@ -0,0 +1,353 @@
+"""Normalised accident / place / vehicle / user tables (a star schema).
+
+The merged dataset inner-joins users and vehicles on ``Num_Acc`` alone, as
+the notebook did, so each user row is repeated for every vehicle of its
+accident and each vehicle for every user. Counting its rows counts neither
+accidents, vehicles nor victims. This module stores the four ONISR tables
+separately, once per entity, one partition per year like the dataset::
+
+    data/tables/accidents/an=2024/part-0.parquet   # caract, key Num_Acc
+    data/tables/places/an=2024/part-0.parquet      # lieux, key Num_Acc
+    data/tables/vehicles/an=2024/part-0.parquet    # vehicules, key id_vehicule
+    data/tables/users/an=2024/part-0.parquet       # usagers, key id_usager
+
+:mod:`roadsafety.etl` writes them next to the dataset, from the raw files.
+For partitions built before, ``python -m roadsafety.schema`` splits them; the
+split tables only hold the entities of the merged rows (no accident or
+vehicle without a victim), so rebuilding from the raw files is better.
+
+:func:`read` joins, for the requested columns only, the tables holding them
+at one of three *grains* (:data:`GRAINS`): one row per accident, per vehicle
+or per victim (user joined to its own vehicle through ``id_vehicule``). A
+table is only read when one of its columns is requested. At the accident
+and vehicle grains, ``grav`` is the most serious injury among the victims
+(the ONISR "accident severity"), see :func:`worst_severity`.
+
+Without the tables, the same rows are read from the merged dataset, keeping
+only the rows of each user with its own vehicle.
+"""
+
+import argparse
+import hashlib
+import json
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from roadsafety import labels, store
+
+TABLES_DIR = store.DATA_DIR / "tables"
+
+# Columns of each table (``an`` is the partition key of all of them), the
+# key first. Derived columns are stored with the table of their sources.
+TABLES = {
+    "accidents": [
+        "Num_Acc", "jour", "mois", "hrmn", "lum", "dep", "com", "agg", "int", "atm", "col",
+        "adr", "lat", "long", "date", "hour", "weekday",
+    ],
+    "places": [
+        "Num_Acc", "catr", "voie", "v1", "v2", "circ", "nbv", "vosp", "prof", "pr", "pr1",
+        "plan", "larrout", "surf", "infra", "situ", "vma",
+    ],
+    "vehicles": [
+        "id_vehicule", "Num_Acc", "num_veh", "senc", "catv", "obs", "obsm", "choc", "manv",
+        "motor", "occutc",
+    ],
+    "users": [
+        "id_usager", "id_vehicule", "Num_Acc", "num_veh", "place", "catu", "grav", "sexe",
+        "trajet", "secu1", "secu2", "secu3", "locp", "actp", "etatp", "age", "tranche_age",
+    ],
+}
+
+# Column names of the merged dataset for the columns renamed by the join.
+MERGED_NAMES = {"users": {"num_veh": "num_veh_x"}, "vehicles": {"num_veh": "num_veh_y"}}
+
+# Grain -> (table with one row per counted entity, its key).
+GRAINS = {
+    "accidents": ("accidents", "Num_Acc"),
+    "vehicles": ("vehicles", "id_vehicule"),
+    "victims": ("users", "id_usager"),
+}
+
+# Tables reachable from each grain, with the column joining them to it.
+JOINS = {
+    "accidents": {"places": "Num_Acc"},
+    "vehicles": {"accidents": "Num_Acc", "places": "Num_Acc"},
+    "victims": {"vehicles": "id_vehicule", "accidents": "Num_Acc", "places": "Num_Acc"},
+}
+
+# grav codes from the most to the least serious (killed, hospitalised, minor, unharmed).
+SEVERITY_ORDER = [2, 3, 4, 1]
+
+
+def table_path(name, year, tables_dir=TABLES_DIR):
+    return Path(tables_dir) / name / f"an={year}" / "part-0.parquet"
+
+
+def has_tables(years=None, tables_dir=TABLES_DIR):
+    """True if every table is stored for each of ``years`` (None: for some year)."""
+    if years is None:
+        return all(any((Path(tables_dir) / name).glob("an=*/*.parquet")) for name in TABLES)
+    return all(table_path(name, year, tables_dir).exists() for name in TABLES for year in years)
+
+
+def open_table(name, tables_dir=TABLES_DIR):
+    """:class:`pyarrow.dataset.Dataset` over the partitions of table ``name``."""
+    return ds.dataset(Path(tables_dir) / name, format="parquet", partitioning=store.PARTITIONING)
+
+
+def read_table(name, columns=None, years=None, tables_dir=TABLES_DIR, where=None):
+    """Typed rows of table ``name`` for ``years``, projected on ``columns``.
+
+    ``where`` is an optional dataset filter expression further selecting the rows.
+    """
+    selected = store.year_filter(years)
+    if where is not None:
+        selected = where if selected is None else selected & where
+    table = open_table(name, tables_dir).to_table(columns=columns, filter=selected)
+    return store.clean_dataset(table.to_pandas(ignore_metadata=True))
+
+
+def columns(tables_dir=TABLES_DIR):
+    """Names of the columns :func:`read` can serve from the stored tables."""
+    names = ["an"]
+    for name in TABLES:
+        names += [c for c in open_table(name, tables_dir).schema.names if c not in names]
+    return names
+
+
+def grain_keys(grain):
+    """Columns identifying one entity of ``grain`` (keys are only unique within a year)."""
+    return ["an", GRAINS[grain][1]]
+
+
+def severity_rank(grav):
+    """Rank of each ``grav`` value (codes or labels) in :data:`SEVERITY_ORDER`, NaN last."""
+    ranks = {code: rank for rank, code in enumerate(SEVERITY_ORDER)}
+    ranks.update({labels.LABELS["grav"][code]: rank for code, rank in list(ranks.items())})
+    return grav.astype(object).map(ranks).astype("float64").fillna(len(SEVERITY_ORDER)).to_numpy()
+
+
+def worst_severity(df, grain):
+    """Most serious ``grav`` of the rows of each ``grain`` entity, for every row of ``df``.
+
+    ``df`` holds victim rows with the :func:`grain_keys` of ``grain``. Returns
+    a Series aligned on ``df``, of the same dtype as its ``grav``.
+    """
+    rank = pd.Series(severity_rank(df["grav"]))
+    keys = [df[k].to_numpy() for k in grain_keys(grain)]
+    worst = rank.groupby(keys, dropna=False, sort=False).transform("idxmin").to_numpy()
+    return df["grav"].iloc[worst].set_axis(df.index)
+
+
+def coarsen(df, grain):
+    """One row per ``grain`` entity of the victim rows ``df``, ``grav`` being the worst one.
+
+    Other columns are taken from the first row of each entity, so they
+    should be columns of that grain (or coarser).
+    """
+    if grain == "victims":
+        return df
+    if "grav" in df.columns:
+        df = df.assign(grav=worst_severity(df, grain))
+    return df.drop_duplicates(grain_keys(grain))
+
+
+def _table_of(column, grain):
+    if column == "an":
+        return GRAINS[grain][0]
+    for name in [GRAINS[grain][0], *JOINS[grain]]:
+        if column in TABLES[name]:
+            return name
+    return None
+
+
+def _read_tables(columns, years, grain, tables_dir, rows=None):
+    # ``rows``: only the first rows of the base table (and what they join to).
+    base, key = GRAINS[grain]
+    wanted = {}
+    for column in columns:
+        if column == "grav" and grain != "victims":
+            continue
+        name = _table_of(column, grain)
+        if name is None:
+            raise ValueError(f"{column!r} is not a column of the {grain} grain")
+        wanted.setdefault(name, []).append(column)
+    joins = {name: JOINS[grain][name] for name in wanted if name != base}
+
+    read = list(dict.fromkeys(["an", key, *wanted.get(base, []), *joins.values()]))
+    if rows is None:
+        df, keys = read_table(base, read, years, tables_dir), None
+    else:
+        keys = open_table(base, tables_dir).head(rows, columns=read, filter=store.year_filter(years))
+        df = store.clean_dataset(keys.to_pandas(ignore_metadata=True))
+    for name, on in joins.items():
+        where = None if keys is None else ds.field(on).isin(pc.unique(keys.column(on)))
+        right = read_table(name, list(dict.fromkeys(["an", on, *wanted[name]])), years, tables_dir, where)
+        df = df.merge(right, on=["an", on], how="left", validate="many_to_one")
+    if "grav" in columns and grain != "victims":
+        # Severity of an accident or vehicle: the worst injury of its victims.
+        users = read_table("users", ["an", key, "grav"], years, tables_dir)
+        worst = coarsen(users, grain)[["an", key, "grav"]]
+        df = df.merge(worst, on=["an", key], how="left", validate="one_to_one")
+    return df[list(columns)]
+
+
+def _own_vehicle(dataset):
+    """Filter keeping the row of each user with its own vehicle, if the dataset tells."""
+    if {"num_veh_x", "num_veh_y"} <= set(dataset.schema.names):
+        return ds.field("num_veh_x") == ds.field("num_veh_y")
+    return None
+
+
+def read(columns, years=None, grain="victims", dataset=None, tables_dir=TABLES_DIR):
+    """Rows of ``grain`` for ``years`` with ``columns``, joining only the tables holding them.
+
+    Read from the stored tables when they cover every year, else from the
+    merged ``dataset``. Rows come in the same order for the same ``years``
+    and ``grain``, so columns read separately line up.
+    """
+    columns = list(columns)
+    if has_tables(years, tables_dir):
+        return _read_tables(columns, years, grain, tables_dir)
+    dataset = dataset or store.open_dataset()
+    read = columns if grain == "victims" else list(dict.fromkeys(columns + grain_keys(grain)))
+    df = store.read_dataset(read, years, dataset, where=_own_vehicle(dataset))
+    return coarsen(df, grain)[columns].reset_index(drop=True)
+
+
+def preview(columns, years=None, dataset=None, tables_dir=TABLES_DIR, rows=10):
+    """First ``rows`` victims of ``years`` with the stored ``columns`` among ``columns``.
+
+    Only the first rows of the users (or merged) data are read, and of the
+    other tables only the rows they join to.
+    """
+    if has_tables(years, tables_dir):
+        columns = [c for c in columns if _table_of(c, "victims") is not None]
+        return _read_tables(columns, years, "victims", tables_dir, rows)
+    dataset = dataset or store.open_dataset()
+    return store.preview(columns, years, dataset, rows, where=_own_vehicle(dataset))
+
+
+def count_rows(years=None, grain="victims", dataset=None, tables_dir=TABLES_DIR):
+    """Number of ``grain`` entities of ``years``, from the Parquet metadata when possible."""
+    if has_tables(years, tables_dir):
+        return open_table(GRAINS[grain][0], tables_dir).count_rows(filter=store.year_filter(years))
+    if grain != "victims":
+        return len(read(grain_keys(grain), years, grain, dataset, tables_dir))
+    dataset = dataset or store.open_dataset()
+    own = _own_vehicle(dataset)
+    selected = store.year_filter(years)
+    if own is not None:
+        selected = own if selected is None else selected & own
+    return dataset.count_rows(filter=selected)
+
+
+def source_mtime(year, tables_dir=TABLES_DIR):
+    """Last modification time of the tables of ``year``, or None without them."""
+    paths = [table_path(name, year, tables_dir) for name in TABLES]
+    return max(p.stat().st_mtime for p in paths) if all(p.exists() for p in paths) else None
+
+
+def data_version(dataset, tables_dir=TABLES_DIR, years=None):
+    """:func:`roadsafety.store.data_version` of ``dataset`` for ``years`` (default: all),
+    also changed by any rewrite of the tables of those years."""
+    version = store.data_version(dataset, years)
+    partitions = ["an=*"] if years is None else [f"an={year}" for year in years]
+    files = sorted(str(p) for partition in partitions for p in Path(tables_dir).glob(f"*/{partition}/*.parquet"))
+    if not files:
+        return version
+    stats = [(path, *store._source_fingerprint(path).values()) for path in files]
+    return hashlib.sha1(json.dumps([version, stats]).encode()).hexdigest()[:12]
+
+
+def split(victims):
+    """The :data:`TABLES` of merged ``victims`` rows (each user with its own vehicle).
+
+    Returns {name: DataFrame}, one row per entity, with ``an`` and the
+    columns of :data:`TABLES` present in ``victims``. Entities without a
+    victim row are missing: :mod:`roadsafety.etl` builds the tables from the
+    raw files instead.
+    """
+    tables = {}
+    for name, names in TABLES.items():
+        merged = {c: MERGED_NAMES.get(name, {}).get(c, c) for c in names}
+        present = {c: m for c, m in merged.items() if m in victims.columns}
+        rows = victims[["an", *present.values()]].rename(columns={m: c for c, m in present.items()})
+        if name != "users":
+            rows = rows.drop_duplicates(["an", names[0]])
+        tables[name] = rows.reset_index(drop=True)
+    return tables
+
+
+@contextmanager
+def table_writer(name, year, tables_dir=TABLES_DIR):
+    """Write the partition of ``year`` of table ``name`` a frame of rows at a time.
+
+    Yields ``write(rows)``. The rows go to a temporary file, which replaces
+    the partition once the block exits without an error.
+    """
+    path = table_path(name, year, tables_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    writer = None
+
+    def write(rows):
+        nonlocal writer
+        table = pa.Table.from_pandas(rows.drop(columns="an", errors="ignore"), preserve_index=False,
+                                     schema=writer.schema if writer else None)
+        if writer is None:
+            writer = pq.ParquetWriter(tmp_path, table.schema, compression="zstd")
+        writer.write_table(table)
+
+    try:
+        yield write
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            tmp_path.unlink(missing_ok=True)
+        raise
+    if writer is not None:
+        writer.close()
+        tmp_path.replace(path)
+
+
+def write_tables(tables, year, tables_dir=TABLES_DIR):
+    """Write the frames of ``tables`` ({name: rows}) as the partitions of ``year``.
+
+    Returns {name: number of rows}.
+    """
+    sizes = {}
+    for name, rows in tables.items():
+        with table_writer(name, year, tables_dir) as write:
+            write(rows)
+        sizes[name] = len(rows)
+    return sizes
+
+
+def split_dataset(years=None, dataset=None, tables_dir=TABLES_DIR):
+    """Split the merged partitions of ``years`` (default: all) into tables, year by year."""
+    dataset = dataset or store.open_dataset()
+    for year in years or store.available_years(dataset):
+        victims = store.read_dataset(years=[year], dataset=dataset, where=_own_vehicle(dataset))
+        yield year, write_tables(split(victims.assign(an=np.int16(year))), year, tables_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split the merged dataset into normalised tables.")
+    parser.add_argument("years", type=int, nargs="*", help="years to split (default: all)")
+    parser.add_argument("--out-dir", type=Path, default=TABLES_DIR)
+    args = parser.parse_args(argv)
+
+    for year, sizes in split_dataset(args.years, tables_dir=args.out_dir):
+        print(f"{year}: " + ", ".join(f"{n:,} {name}" for name, n in sizes.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""The dashboard rows as one memory-mapped Arrow IPC (Feather v2) file.
+
+Each Streamlit server process otherwise decodes the Parquet columns it
+needs into its own memory. :func:`build` writes those columns once, ready
+to use, into ``data/dataset.arrow``: uncompressed, one record batch with
+the rows of every year in year order, coded columns already as category
+numbers. :func:`open_shared` memory-maps it, and :meth:`SharedDataset.column`
+wraps the mapped buffers into pandas without copying them, so all the
+processes of a host share a single copy of the rows in the OS page cache::
+
+    python -m roadsafety.shared          # after the ETL or the schema split
+
+A column is zero-copy when the selected years are consecutive (a slice of
+the file); other selections are concatenated. The file records the data
+version it was built from (:func:`roadsafety.schema.data_version`); a stale
+file, or one labelled by an older release of :mod:`roadsafety.labels`, is
+ignored until it is rebuilt. It is replaced atomically, so processes
+still mapping the previous one keep reading it safely.
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from roadsafety import labels, schema, store
+
+SHARED_PATH = store.DATA_DIR / "dataset.arrow"
+
+# Metadata keys of the file.
+VERSION_KEY = b"roadsafety.version"
+YEARS_KEY = b"roadsafety.years"
+CATEGORIES_KEY = b"roadsafety.categories"
+
+
+def _encode(df):
+    """Arrow arrays of the columns of ``df`` and the categories of the categorical ones."""
+    arrays, categories = {}, {}
+    for name in df.columns:
+        values = labels.categorical(df[name], name) if name in labels.LABELS else df[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories[name] = {"values": values.cat.categories.tolist(), "ordered": bool(values.cat.ordered)}
+            arrays[name] = pa.array(values.cat.codes.to_numpy())
+        elif pd.api.types.is_float_dtype(values.dtype):
+            # NaN rather than nulls, so the column maps to a plain float array.
+            arrays[name] = pa.array(values.to_numpy(dtype="float64", na_value=np.nan))
+        else:
+            arrays[name] = pa.Array.from_pandas(values)
+    return arrays, categories
+
+
+def _recode(codes, categories, merged):
+    """Category numbers ``codes`` of ``categories`` as numbers of ``merged`` (extended in place)."""
+    values = merged.setdefault("values", [])
+    for value in categories["values"]:
+        if value not in values:
+            values.append(value)
+    merged.setdefault("ordered", categories["ordered"])
+    mapping = np.array([values.index(v) for v in categories["values"]], dtype=np.int16)
+    if np.array_equal(mapping, np.arange(len(mapping))):
+        return codes
+    codes = codes.to_numpy(zero_copy_only=False)
+    return pa.array(np.where(codes >= 0, mapping[np.maximum(codes, 0)], -1).astype(np.int16))
+
+
+def build(columns, dataset=None, tables_dir=schema.TABLES_DIR, path=SHARED_PATH, years=None):
+    """Write the victim rows of every year, projected on ``columns``, to ``path``.
+
+    Columns the data cannot serve are left out. With ``years``, only the rows
+    of those years are read from the data; the other years are copied from
+    the file already at ``path`` (if built with the same columns), so adding
+    or replacing a year only reads that year. Returns the number of rows.
+    """
+    dataset = dataset or store.open_dataset()
+    available = set(store.dataset_columns(dataset))
+    columns = [c for c in columns if c in available]
+    previous = open_shared(path) if years is not None else None
+    if previous is not None and previous.columns != columns:
+        previous = None
+    version = schema.data_version(dataset, tables_dir)
+
+    index, parts, categories, offset = {}, [], {}, 0
+    for year in store.available_years(dataset):
+        if previous is not None and year not in years and year in previous.years:
+            start, length = previous.years[year]
+            part = {c: previous.table.column(c).chunk(0).slice(start, length) for c in columns}
+            part_categories = previous.categories
+        else:
+            part, part_categories = _encode(schema.read(columns, [year], dataset=dataset, tables_dir=tables_dir))
+            length = len(part[columns[0]]) if columns else 0
+        for name, values in part_categories.items():
+            part[name] = _recode(part[name], values, categories.setdefault(name, {}))
+        parts.append(pa.table(part))
+        index[int(year)] = [offset, length]
+        offset += length
+    table = pa.concat_tables(parts, promote_options="permissive").combine_chunks()
+    for name, values in categories.items():
+        # Category numbers in the smallest integer type holding them.
+        table = table.set_column(table.column_names.index(name), name,
+                                 table.column(name).cast(pa.int8() if len(values["values"]) < 128 else pa.int16()))
+    table = table.replace_schema_metadata({
+        VERSION_KEY: version.encode(),
+        YEARS_KEY: json.dumps(index).encode(),
+        CATEGORIES_KEY: json.dumps(categories).encode(),
+    })
+    # A single record batch: every column is one contiguous buffer.
+    tmp_path = Path(path).with_suffix(f".arrow.{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    tmp_path.replace(path)
+    return table.num_rows
+
+
+class SharedDataset:
+    """Memory-mapped rows written by :func:`build`."""
+
+    def __init__(self, path=SHARED_PATH):
+        self.path = Path(path)
+        self._source = pa.memory_map(str(self.path))
+        self.table = pa.ipc.open_file(self._source).read_all()
+        metadata = self.table.schema.metadata
+        self.version = metadata[VERSION_KEY].decode()
+        self.years = {int(y): rows for y, rows in json.loads(metadata[YEARS_KEY]).items()}
+        self.categories = json.loads(metadata[CATEGORIES_KEY])
+        self.columns = list(self.table.column_names)
+
+    def ranges(self, years=None):
+        """(offset, length) of the rows of ``years``, consecutive years merged."""
+        ranges = []
+        for year in sorted(self.years if years is None else years):
+            offset, length = self.years.get(int(year), (0, 0))
+            if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+                ranges[-1][1] += length
+            elif length:
+                ranges.append([offset, length])
+        return ranges or [[0, 0]]
+
+    def labels_changed(self):
+        """True if the coded columns were labelled otherwise than by :mod:`roadsafety.labels` now."""
+        return any(
+            categories["values"] != list(labels.dtype(name).categories)
+            for name, categories in self.categories.items() if name in labels.LABELS
+        )
+
+    def _series(self, name, array):
+        if name in self.categories:
+            categories = self.categories[name]
+            dtype = pd.CategoricalDtype(categories["values"], ordered=categories["ordered"])
+            values = pd.Categorical.from_codes(array.to_numpy(zero_copy_only=True), dtype=dtype)
+        elif array.null_count == 0 and pa.types.is_primitive(array.type) and not pa.types.is_boolean(array.type):
+            values = array.to_numpy(zero_copy_only=True)
+        else:
+            # Strings and nullable integers stay Arrow arrays, still zero-copy.
+            values = pd.arrays.ArrowExtensionArray(array)
+        return pd.Series(values, name=name, copy=False)
+
+    def column(self, name, years=None):
+        """Column ``name`` of the rows of ``years`` (default: all), over the mapped file."""
+        array = self.table.column(name).chunk(0)
+        parts = [self._series(name, array.slice(offset, length)) for offset, length in self.ranges(years)]
+        return parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+
+def update(years, dataset=None, tables_dir=schema.TABLES_DIR, path=SHARED_PATH):
+    """Merge the rows of ``years`` into the file at ``path``, if it was built.
+
+    Only those years are read (see :func:`build`), unless the file was
+    labelled by an older release. Returns the number of rows, or None
+    without a file to update.
+    """
+    previous = open_shared(path)
+    if previous is None:
+        return None
+    if previous.labels_changed():
+        years = None  # its other years would keep the old labels
+    return build(previous.columns, dataset, tables_dir, path, years=years)
+
+
+def open_shared(path=SHARED_PATH):
+    """The :class:`SharedDataset` at ``path``, or None if it was not built."""
+    return SharedDataset(path) if Path(path).exists() else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the memory-mapped dataset shared by the app processes.")
+    parser.add_argument("--out", type=Path, default=SHARED_PATH)
+    args = parser.parse_args(argv)
+
+    rows = build(store.APP_COLUMNS, path=args.out)
+    print(f"Wrote {args.out} ({rows:,} rows, {args.out.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Versioned snapshots of the data, reloaded in the background.
+
+A :class:`Snapshot` is everything the dashboard derives from the files of
+``data/`` at one point in time: the opened dataset, its years and columns,
+the data version of each year and the memory-mapped rows if they are up to
+date. It never changes once loaded.
+
+A :class:`Watcher` serves the current snapshot and looks at the data
+directory every :data:`POLL_SECONDS`. Once a change has settled (the files
+are the same on two looks in a row, so a release being written is not read
+halfway), it loads a new snapshot in its own thread, lets the caller prepare
+it (e.g. warm its caches up) and then swaps it in: a single reference
+assignment, so a reader gets the old or the new snapshot, never a mix of
+both. Readers never wait for a reload and only the watcher reloads, however
+many sessions are open.
+
+Caches key their entries by :meth:`Snapshot.version_of` the years they
+hold: after a swap, the entries of years whose data did not change are still
+valid, and those of the old version are no longer looked up. A
+:class:`VersionedCache` also drops them (:meth:`VersionedCache.discard`), so
+the values computed from the old data do not stay in memory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from pathlib import Path
+
+from roadsafety import cube, schema, shared, store
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two looks at the data directory (0: never reload).
+POLL_SECONDS = float(os.environ.get("ROADSAFETY_RELOAD_SECONDS") or 5)
+
+# Files and directories the snapshots are loaded from. The Parquet cache of
+# the CSV is left out: it is rewritten by loading a new CSV.
+WATCHED = [store.DATASET_CSV, store.DATASET_DIR, schema.TABLES_DIR, shared.SHARED_PATH, cube.CUBE_DIR]
+
+
+def fingerprint(paths=WATCHED):
+    """Short hash of the names, sizes and modification times of the files under ``paths``.
+
+    Temporary files of a write in progress are ignored.
+    """
+    files = []
+    for path in map(Path, paths):
+        found = [path] if path.is_file() else sorted(p for p in path.rglob("*") if p.is_file())
+        for p in found:
+            if p.name.endswith(".tmp"):
+                continue
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue  # replaced meanwhile
+            files.append((str(p), stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(json.dumps(files).encode()).hexdigest()[:12]
+
+
+class Snapshot:
+    """The data as loaded at one point in time, see the module docstring."""
+
+    def __init__(self, dataset, tables_dir=schema.TABLES_DIR, shared_path=shared.SHARED_PATH, columns=(),
+                 cube_dir=cube.CUBE_DIR):
+        self.dataset = dataset
+        self.years = store.available_years(dataset)
+        self.columns = store.dataset_columns(dataset)
+        self.version = schema.data_version(dataset, tables_dir)
+        self.versions = {int(y): schema.data_version(dataset, tables_dir, [y]) for y in self.years}
+        if self.version == "memory":
+            # The CSV served from memory: versioned by the CSV file itself.
+            self.version = f"memory-{fingerprint([store.DATASET_CSV])}"
+            self.versions = dict.fromkeys(self.versions, self.version)
+        self.shared = self._shared(shared_path, columns)
+        # The cube does not change the data, only how fast it is counted.
+        self.cube = fingerprint([cube_dir])
+        self.loaded = datetime.now()
+
+    @classmethod
+    def load(cls, columns=(), tables_dir=schema.TABLES_DIR, shared_path=shared.SHARED_PATH):
+        """Snapshot of the data on disk now; ``columns`` are the ones the memory-mapped rows must hold."""
+        # Opening the dataset also rebuilds a stale Parquet cache of the CSV.
+        return cls(store.open_dataset(), tables_dir, shared_path, columns)
+
+    def _shared(self, path, columns):
+        # The memory-mapped rows, if built from this version with every column
+        # and the current labels.
+        mapped = shared.open_shared(path)
+        if mapped is None or mapped.version != self.version:
+            return None
+        if not set(columns) & set(self.columns) <= set(mapped.columns):
+            return None
+        return None if mapped.labels_changed() else mapped
+
+    def version_of(self, years=None):
+        """Data version of ``years`` (default: all), unchanged by changes to other years."""
+        if years is None:
+            return self.version
+        versions = [self.versions.get(int(y), "") for y in sorted(years)]
+        if len(versions) == 1:
+            return versions[0]
+        return hashlib.sha1(json.dumps(versions).encode()).hexdigest()[:12]
+
+
+class VersionedCache:
+    """Bounded LRU cache of values computed from the data. Thread-safe.
+
+    Keys start with ``(years, version)``, the :meth:`Snapshot.version_of`
+    ``years`` the value was computed from. Concurrent callers of a missing
+    key wait for a single computation.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._values = OrderedDict()
+        self._computing = {}
+        self._current = None
+        self._replaced = deque(maxlen=4)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, compute):
+        """Value cached under ``key``, computed by ``compute()`` on a miss."""
+        with self._lock:
+            if key in self._values:
+                self._values.move_to_end(key)
+                return self._values[key]
+            computing = self._computing.setdefault(key, threading.Lock())
+        with computing:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            try:
+                value = compute()
+                with self._lock:
+                    # A late reader of a replaced version gets its value, uncached.
+                    if not self._is_replaced(key):
+                        self._values[key] = value
+                        while len(self._values) > self.max_entries:
+                            self._values.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._computing.pop(key, None)
+        return value
+
+    def _is_replaced(self, key):
+        years, version = key[:2]
+        if self._current is None or self._current.version_of(years) == version:
+            return False
+        return any(s.version_of(years) == version for s in self._replaced)
+
+    def discard(self, previous, current):
+        """Drop the values not computed from the data of ``current``, which replaced ``previous``.
+
+        Values of ``previous`` computed later are not kept either. Returns how many were dropped.
+        """
+        with self._lock:
+            self._replaced.append(previous)
+            self._current = current
+            stale = [key for key in self._values if key[1] != current.version_of(key[0])]
+            for key in stale:
+                del self._values[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Watcher:
+    """The current :class:`Snapshot`, replaced by a new one when the data changes.
+
+    ``load()`` returns a new snapshot. ``prepare(snapshot)``, if given, runs
+    in the watcher thread before a new snapshot is swapped in, and
+    ``on_swap(previous, current)`` right after. The last ``keep`` snapshots
+    stay available to readers still using an older version (:meth:`recent`).
+    """
+
+    def __init__(self, load=Snapshot.load, paths=WATCHED, interval=POLL_SECONDS,
+                 prepare=None, on_swap=None, keep=2):
+        self.paths = paths
+        self.interval = interval
+        self._load = load
+        self._prepare = prepare
+        self._on_swap = on_swap
+        self._current = None
+        self._recent = deque(maxlen=keep)
+        self._fingerprint = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """The current snapshot, loaded by the first caller (the others wait for it)."""
+        snapshot = self._current
+        if snapshot is None:
+            with self._lock:
+                if self._current is None:
+                    seen = fingerprint(self.paths)
+                    self._swap(self._load(), seen)
+                snapshot = self._current
+        return snapshot
+
+    def recent(self):
+        """The snapshots kept, newest (the current one) first."""
+        return list(self._recent)
+
+    def poll(self):
+        """Swap in a new snapshot if the data changed and has not changed since the last poll.
+
+        Returns True if a new snapshot was swapped in.
+        """
+        with self._lock:
+            seen = fingerprint(self.paths)
+            if seen == self._fingerprint or self._current is None:
+                self._pending = None
+                return False
+            if seen != self._pending:
+                # Still being written, or just changed: look again next time.
+                self._pending = seen
+                return False
+            snapshot = self._load()
+            if self._prepare is not None:
+                self._prepare(snapshot)
+            previous = self._current
+            self._swap(snapshot, seen)
+        logger.info("Data version %s replaced by %s", previous.version, snapshot.version)
+        if self._on_swap is not None:
+            self._on_swap(previous, snapshot)
+        return True
+
+    def _swap(self, snapshot, seen):
+        self._recent.appendleft(snapshot)
+        self._current = snapshot
+        self._fingerprint = seen
+        self._pending = None
+
+    def start(self):
+        """Poll in a background thread every :attr:`interval` seconds (never if 0). Returns self."""
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="roadsafety-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Loading the new data failed; still serving version %s", self._current.version)
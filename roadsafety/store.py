@@ -0,0 +1,326 @@
+"""On-disk storage of the merged dataset.
+
+The preferred layout is the output of :mod:`roadsafety.etl`: one hive-style
+Parquet partition per year under ``data/dataset/an=<year>/``. Reading a subset
+of years only opens the matching partitions.
+
+Without it, ``df_dataset.csv`` (the single-file merge) is used. Parsing it is
+slow (text, decimal-comma coordinates), so :func:`build_cache` converts it once
+into a typed Parquet file next to it, and the CSV is only parsed again when it
+is newer than that cache.
+
+Either way :func:`read_dataset` goes through :func:`open_dataset`, so column
+projection and year filters are pushed down to the Parquet reader.
+
+This module has no Streamlit dependency so it can be used from scripts.
+"""
+
+import argparse
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATA_DIR = Path("./data")
+DATASET_CSV = DATA_DIR / "df_dataset.csv"
+DATASET_PARQUET = DATA_DIR / "df_dataset.parquet"
+# Output of roadsafety.etl: one hive-style partition per year (an=2024/...).
+DATASET_DIR = DATA_DIR / "dataset"
+PARTITIONING = ds.partitioning(pa.schema([("an", pa.int16())]), flavor="hive")
+
+# Integer code columns described in description-des-bases-de-donnees-annuelles.pdf.
+# All of them fit in a signed byte (-1 is used for "not specified").
+CODE_DTYPES = {
+    "grav": "int8",
+    "catv": "int8",
+    "catu": "int8",
+    "atm": "int8",
+    "surf": "int8",
+    "lum": "int8",
+    "catr": "int8",
+    "trajet": "int8",
+    "place": "int8",
+    "sexe": "int8",
+}
+
+# Identifier-like columns that must stay text (e.g. '01', '2A', '971').
+TEXT_DTYPES = {
+    "dep": "string",
+    "com": "string",
+    "hrmn": "string",
+}
+
+DTYPES = {**CODE_DTYPES, **TEXT_DTYPES}
+
+# Coordinates are published with a decimal comma ("48,8566").
+COORD_COLUMNS = ["lat", "long"]
+
+# Low-cardinality text columns stored as categoricals in the cache.
+CATEGORY_COLUMNS = ["dep"]
+
+# Age groups used by the victims analysis.
+AGE_BINS = [10, 20, 30, 40, 50, 60, 70, 80, 120]
+AGE_LABELS = ["10-20", "21-30", "31-40", "41-50", "51-60", "61-70", "71-80", "81-120"]
+
+# Columns derived once at ingest (see :func:`derived_columns`), with the raw
+# columns each one is computed from.
+DERIVED_COLUMNS = {
+    "date": ["an", "mois", "jour"],
+    "hour": ["hrmn"],
+    "weekday": ["an", "mois", "jour"],
+    "tranche_age": ["age"],
+}
+
+# Columns the dashboard pages may load (see roadsafety.data); everything
+# else stays on disk.
+APP_COLUMNS = [
+    "Num_Acc", "jour", "mois", "an", "hrmn", "dep", "lat", "long",
+    "lum", "atm", "surf", "catr", "vma",
+    "place", "catu", "grav", "sexe", "trajet", "age", "catv",
+    "date", "hour", "weekday", "tranche_age", "id_vehicule",
+]
+
+# Metadata key recording which CSV the Parquet cache was built from.
+SOURCE_KEY = b"roadsafety.source"
+
+
+def _source_fingerprint(path):
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+AGE_DTYPE = pd.CategoricalDtype(AGE_LABELS, ordered=True)
+
+
+def age_band(age):
+    """Categorical age group of each value of the ``age`` Series."""
+    return pd.cut(age, bins=AGE_BINS, labels=AGE_LABELS, include_lowest=True).astype(AGE_DTYPE)
+
+
+def _hour(hrmn):
+    """Hour of day of each ``hrmn`` value ('HH:MM', or 'HHMM' in old releases)."""
+    # A day has at most 1440 distinct times: parse each of them only once.
+    times = hrmn.astype("string").astype("category")
+    digits = times.cat.categories.str.replace(":", "", regex=False).str.zfill(4).str[:-2]
+    hours = pd.Series(pd.to_numeric(digits, errors="coerce"), index=times.cat.categories)
+    return times.map(hours).astype("float64").astype("Int8").rename("hour")
+
+
+def derived_columns(df):
+    """The :data:`DERIVED_COLUMNS` of the rows of ``df``.
+
+    ``date`` is a datetime64 (NaT for invalid dates), ``weekday`` counts from
+    0 = Monday and ``tranche_age`` is the :data:`AGE_LABELS` group of ``age``.
+    Only the columns whose sources are in ``df`` are returned, as a dict of
+    Series ready for ``df.assign``.
+    """
+    columns = {}
+    if {"an", "mois", "jour"} <= set(df.columns):
+        parts = df[["an", "mois", "jour"]].astype("float64")
+        parts.columns = ["year", "month", "day"]
+        date = pd.to_datetime(parts, errors="coerce")
+        columns["date"] = date
+        columns["weekday"] = date.dt.weekday.astype("Int8")
+    if "hrmn" in df.columns:
+        columns["hour"] = _hour(df["hrmn"])
+    if "age" in df.columns:
+        columns["tranche_age"] = age_band(df["age"])
+    return columns
+
+
+def clean_dataset(df):
+    """Return the typed version of a raw merged frame (modified in place)."""
+    for col in COORD_COLUMNS:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col].str.replace(",", ".", regex=False), errors="coerce")
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    if "tranche_age" in df.columns:
+        # Parquet keeps the labels but not always their order.
+        df["tranche_age"] = df["tranche_age"].astype(AGE_DTYPE)
+    for col in df.select_dtypes(include="integer").columns:
+        if col not in CODE_DTYPES:
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+
+def read_csv(path=DATASET_CSV, columns=None):
+    """Parse the merged CSV with explicit dtypes, clean it and add the derived columns."""
+    df = clean_dataset(pd.read_csv(path, dtype=DTYPES, usecols=columns, low_memory=False))
+    return df.assign(**derived_columns(df))
+
+
+def cache_is_fresh(csv_path=DATASET_CSV, parquet_path=DATASET_PARQUET):
+    """True if the Parquet cache exists and was built from the current CSV."""
+    parquet_path = Path(parquet_path)
+    if not parquet_path.exists():
+        return False
+    if not Path(csv_path).exists():
+        # Deployed without the CSV: the cache is all we have.
+        return True
+    metadata = pq.read_schema(parquet_path).metadata or {}
+    if SOURCE_KEY not in metadata:
+        return False
+    return json.loads(metadata[SOURCE_KEY]) == _source_fingerprint(csv_path)
+
+
+def write_cache(df, csv_path=DATASET_CSV, parquet_path=DATASET_PARQUET):
+    """Write the typed frame ``df`` parsed from ``csv_path`` as the Parquet cache."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_KEY] = json.dumps(_source_fingerprint(csv_path)).encode()
+    table = table.replace_schema_metadata(metadata)
+    tmp_path = Path(parquet_path).with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    tmp_path.replace(parquet_path)
+
+
+def build_cache(csv_path=DATASET_CSV, parquet_path=DATASET_PARQUET):
+    """Convert the CSV into the typed Parquet cache and return the full frame."""
+    df = read_csv(csv_path)
+    write_cache(df, csv_path, parquet_path)
+    return df
+
+
+def has_partitions(dataset_dir=DATASET_DIR):
+    """True if the yearly partitions written by roadsafety.etl are present."""
+    return any(Path(dataset_dir).glob("an=*/*.parquet"))
+
+
+def open_dataset(csv_path=DATASET_CSV, parquet_path=DATASET_PARQUET, dataset_dir=DATASET_DIR):
+    """Return a :class:`pyarrow.dataset.Dataset` over the best available source.
+
+    Yearly partitions win over the single-file cache. A stale cache is rebuilt
+    from the CSV; if the data directory is read-only the parsed CSV is served
+    from memory instead.
+    """
+    if has_partitions(dataset_dir):
+        return ds.dataset(dataset_dir, format="parquet", partitioning=PARTITIONING)
+    if not cache_is_fresh(csv_path, parquet_path):
+        df = read_csv(csv_path)
+        try:
+            write_cache(df, csv_path, parquet_path)
+        except OSError:
+            return ds.dataset(pa.Table.from_pandas(df, preserve_index=False))
+    return ds.dataset(parquet_path, format="parquet")
+
+
+def year_filter(years):
+    """Dataset filter expression selecting ``years`` (None means all)."""
+    if years is None:
+        return None
+    return ds.field("an").isin([int(y) for y in years])
+
+
+def available_years(dataset=None):
+    """Sorted list of the years present in the dataset."""
+    dataset = dataset or open_dataset()
+    # One partition per year: answer from the partition keys alone.
+    keys = [ds.get_partition_keys(f.partition_expression).get("an") for f in dataset.get_fragments()]
+    if keys and None not in keys:
+        return sorted(set(keys))
+    return sorted(dataset.to_table(columns=["an"]).column("an").unique().to_pylist())
+
+
+def dataset_columns(dataset=None):
+    """Names of the columns the dataset can serve (reads the schema only).
+
+    Derived columns are included when they can be computed from stored columns.
+    """
+    names = list((dataset or open_dataset()).schema.names)
+    derived = [c for c, sources in DERIVED_COLUMNS.items() if c not in names and set(sources) <= set(names)]
+    return names + derived
+
+
+def source_mtime(dataset, year):
+    """Last modification time of the files holding ``year``, or None if in memory."""
+    if not isinstance(dataset, ds.FileSystemDataset):
+        return None
+    paths = [f.path for f in dataset.get_fragments(filter=year_filter([year]))]
+    return max((Path(p).stat().st_mtime for p in paths), default=None)
+
+
+def data_version(dataset, years=None):
+    """Short fingerprint of the files ``dataset`` reads for ``years`` (default: all),
+    changed by any rewrite of them.
+
+    A dataset held in memory never changes and is always version ``"memory"``.
+    """
+    if not isinstance(dataset, ds.FileSystemDataset):
+        return "memory"
+    paths = dataset.files if years is None else [f.path for f in dataset.get_fragments(filter=year_filter(years))]
+    files = sorted((path, *_source_fingerprint(path).values()) for path in paths)
+    return hashlib.sha1(json.dumps(files).encode()).hexdigest()[:12]
+
+
+def read_dataset(columns=None, years=None, dataset=None, where=None):
+    """Read the typed dataset, projecting ``columns`` and keeping only ``years``.
+
+    Both are pushed down to the Parquet reader: partitions of other years are
+    never opened and unused columns are never decoded. ``where`` is an
+    optional dataset filter expression further selecting the rows.
+    """
+    dataset = dataset or open_dataset()
+    stored = dataset.schema.names
+    # Data written before the derived columns existed: compute them on the fly.
+    missing = [c for c in (columns or DERIVED_COLUMNS) if c in DERIVED_COLUMNS and c not in stored]
+    read = columns
+    if columns is not None and missing:
+        sources = [s for c in missing for s in DERIVED_COLUMNS[c]]
+        read = list(dict.fromkeys([c for c in columns if c not in missing] + sources))
+    selected = year_filter(years)
+    if where is not None:
+        selected = where if selected is None else selected & where
+    table = dataset.to_table(columns=read, filter=selected)
+    # Nullable columns written by the ETL come back as plain NumPy dtypes.
+    df = clean_dataset(table.to_pandas(ignore_metadata=True))
+    if missing:
+        derived = derived_columns(df)
+        df = df.assign(**{c: derived[c] for c in missing if c in derived})
+        if columns is not None:
+            df = df[columns]
+    return df
+
+
+def preview(columns=None, years=None, dataset=None, rows=10, where=None):
+    """First ``rows`` rows of ``years``, reading only the first record batches.
+
+    Only stored ``columns`` are returned (derived columns are not computed).
+    ``where`` is an optional dataset filter expression further selecting the rows.
+    """
+    dataset = dataset or open_dataset()
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    selected = year_filter(years)
+    if where is not None:
+        selected = where if selected is None else selected & where
+    table = dataset.head(rows, columns=columns, filter=selected)
+    return clean_dataset(table.to_pandas(ignore_metadata=True))
+
+
+def count_rows(years=None, dataset=None):
+    """Number of rows of ``years``, from the Parquet metadata when possible."""
+    return (dataset or open_dataset()).count_rows(filter=year_filter(years))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the Parquet cache of df_dataset.csv.")
+    parser.add_argument("--csv", type=Path, default=DATASET_CSV)
+    parser.add_argument("--out", type=Path, default=DATASET_PARQUET)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the cache is fresh")
+    args = parser.parse_args(argv)
+
+    if not args.force and cache_is_fresh(args.csv, args.out):
+        print(f"{args.out} is up to date")
+        return
+    df = build_cache(args.csv, args.out)
+    print(f"Wrote {args.out} ({len(df):,} rows, {args.out.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Warm-up of the dashboard caches.
+
+The first visitor of each page after a deploy would otherwise pay for
+opening the dataset, reading the columns, building the bitmaps and every
+aggregate of the page. :func:`warm_up` computes all of them for the default
+sidebar state (latest year, no filter), logging each step, so they are
+already cached when a real user arrives.
+
+In the server, :mod:`roadsafety.data` runs it in a background thread when
+it first opens the data, whatever page is asked for first, and again on
+each new snapshot before it is swapped in. Pages are served meanwhile (a
+page asking for an aggregate being warmed up waits for that one computation
+instead of starting another). As a command it first brings the Parquet cache, the
+cube of those years and the memory-mapped dataset (:mod:`roadsafety.shared`)
+up to date on disk, downloads the department boundaries if missing, then
+primes everything once::
+
+    python -m roadsafety.warmup            # latest year
+    python -m roadsafety.warmup 2023 2024
+
+Streamlit caches live in the server process: run from the command line, only
+the files written to ``data/`` outlast the command.
+"""
+
+import argparse
+import logging
+import time
+
+from roadsafety import analysis, cube, data, departments, geo, labels, schema, shared, store
+
+logger = logging.getLogger(__name__)
+
+
+def default_years():
+    """Years selected in the sidebar by default (see :func:`roadsafety.data.select_years`)."""
+    return data.available_years()[-1:]
+
+
+def tasks(years):
+    """``(page, step, function)`` of every aggregate the pages compute by default.
+
+    The Conclusions page is static text and has none.
+    """
+    area = next(iter(geo.AREAS))
+    gravs = list(labels.LABELS["grav"])
+    count = data.counter(years)
+    return [
+        ("Home", "summary", lambda: data.summary(years)),
+        ("Home", "preview", lambda: data.preview(years)),
+        ("Home", "documentation", data.documentation_pdf),
+        ("Home", "department filter", lambda: data.department_options(years)),
+        ("Global Overview", "KPIs", lambda: data.kpis(years)),
+        ("Global Overview", "daily counts", lambda: data.daily_counts(years)),
+        ("Global Overview", f"map of {area}", lambda: data.map_data(years, area, gravs)),
+        ("Location & Factors", "department boundaries", departments.geojson),
+        *[(page, table.__name__, lambda table=table: table(count))
+          for page, tables in analysis.PAGES.items() for table in tables],
+    ]
+
+
+def warm_up(years=None):
+    """Compute every aggregate of :func:`tasks` for ``years`` (default: :func:`default_years`).
+
+    A failing step is logged and skipped. Returns the number of failed steps.
+    """
+    started = time.perf_counter()
+    years = list(years or default_years())
+    steps = tasks(years)
+    failed = 0
+    logger.info("Warming up %d steps for %s", len(steps), data.years_label(years))
+    for i, (page, step, function) in enumerate(steps, 1):
+        step_started = time.perf_counter()
+        try:
+            function()
+        except Exception:
+            failed += 1
+            logger.exception("[%d/%d] %s: %s failed", i, len(steps), page, step)
+            continue
+        logger.info("[%d/%d] %s: %s (%.2f s)", i, len(steps), page, step, time.perf_counter() - step_started)
+    logger.info("Warm-up done in %.1f s (%d failed)", time.perf_counter() - started, failed)
+    return failed
+
+
+def refresh_cube(years, dataset=None, workers=None):
+    """Rebuild the cuboids of ``years`` that are missing or older than the data, a year per worker."""
+    dataset = dataset or store.open_dataset()
+    stale = [y for y in years if not all(cube.is_fresh(name, y, dataset) for name in cube.CUBOIDS)]
+    if not stale:
+        return
+    started = time.perf_counter()
+    for year, sizes in cube.build_cube(stale, dataset, workers=workers):
+        logger.info("Built the cube of %d: %s cells", year, f"{sum(sizes.values()):,}")
+    logger.info("Built the cube of %d years (%.1f s)", len(stale), time.perf_counter() - started)
+
+
+def refresh_shared(dataset=None):
+    """Rebuild the memory-mapped dataset (:mod:`roadsafety.shared`) if it is older than the data."""
+    dataset = dataset or store.open_dataset()
+    mapped = shared.open_shared()
+    if mapped is not None and mapped.version == schema.data_version(dataset) and not mapped.labels_changed():
+        return
+    started = time.perf_counter()
+    rows = shared.build(store.APP_COLUMNS, dataset)
+    logger.info("Wrote %s: %s rows (%.1f s)", shared.SHARED_PATH, f"{rows:,}", time.perf_counter() - started)
+
+
+def refresh_geojson():
+    """Download the department boundaries (:func:`roadsafety.departments.fetch_geojson`) if missing."""
+    if departments.GEOJSON_PATH.exists():
+        return
+    try:
+        count = departments.fetch_geojson()
+    except (OSError, ValueError) as error:
+        logger.warning("Could not download the department boundaries (%s); maps will draw bubbles only", error)
+        return
+    logger.info("Wrote %s: %d departments", departments.GEOJSON_PATH, count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm up the dashboard caches.")
+    parser.add_argument("years", type=int, nargs="*", help="years to warm up (default: the latest)")
+    parser.add_argument("--no-cube", action="store_true", help="do not rebuild stale cuboids")
+    parser.add_argument("--workers", type=int, help="worker processes rebuilding the cube")
+    parser.add_argument("--no-shared", action="store_true",
+                        help="do not rebuild a stale memory-mapped dataset (data/dataset.arrow)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    # Opening the dataset also rebuilds a stale Parquet cache of the CSV.
+    years = args.years or default_years()
+    if not args.no_cube:
+        refresh_cube(years, workers=args.workers)
+    if not args.no_shared:
+        refresh_shared()
+    refresh_geojson()
+    raise SystemExit(1 if warm_up(years) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Bitmap indexes of roadsafety.bitmap against plain boolean masks."""
+
+import numpy as np
+import pandas as pd
+
+from roadsafety import bitmap
+
+# Not a multiple of 64: the last word is partly used.
+ROWS = 1000
+
+
+def codes(seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.Series(rng.choice([1, 2, 3, 4, np.nan], size=ROWS))
+
+
+def test_pack_round_trip():
+    mask = codes().eq(2).to_numpy()
+    words = bitmap.pack(mask)
+    assert len(words) == -(-ROWS // 64)
+    assert np.array_equal(bitmap.unpack(words, ROWS), mask)
+    assert bitmap.count(words) == mask.sum()
+    positions = [0, 63, 64, 500, ROWS - 1]
+    assert np.array_equal(bitmap.test(words, positions), mask[positions])
+    assert bitmap.count(bitmap.full(ROWS)) == ROWS
+
+
+def test_selections_match_the_masks():
+    grav, catv = codes(0), codes(1)
+    bitmaps = bitmap.build(grav)
+    assert sorted(bitmaps) == [1, 2, 3, 4]  # no bitmap for missing values
+
+    selected = bitmap.any_of(bitmaps, [2, 3, 9], ROWS)
+    assert np.array_equal(bitmap.unpack(selected, ROWS), grav.isin([2, 3]).to_numpy())
+    both = bitmap.all_of([selected, bitmap.any_of(bitmap.build(catv), [1], ROWS)])
+    assert np.array_equal(bitmap.unpack(both, ROWS), (grav.isin([2, 3]) & catv.eq(1)).to_numpy())
+
+    counts = bitmap.value_counts(bitmaps, both)
+    expected = grav[grav.isin([2, 3]) & catv.eq(1)].value_counts()
+    assert counts == {value: int(expected.get(value, 0)) for value in [1, 2, 3, 4]}
+
+
+def test_categories_without_rows_get_an_empty_bitmap():
+    values = pd.Series(pd.Categorical(["Killed", "Unharmed"], categories=["Unharmed", "Killed", "Minor injuries"]))
+    counts = bitmap.value_counts(bitmap.build(values))
+    assert counts == {"Unharmed": 1, "Killed": 1, "Minor injuries": 0}
@@ -0,0 +1,51 @@
+"""Counts of roadsafety.data over a synthetic year of raw files."""
+
+import pandas as pd
+import pytest
+
+from roadsafety import bench, cube, data, etl, schema, snapshot, store
+from roadsafety import filters as filtering
+
+
+@pytest.fixture(scope="module")
+def year(tmp_path_factory):
+    # The data paths are relative to the working directory: build ./data there.
+    work = tmp_path_factory.mktemp("data")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(work)
+        bench.generate(2000, work / "raw", bench.YEAR)
+        etl.build_year(bench.YEAR, work / "raw", store.DATASET_DIR, tables_dir=schema.TABLES_DIR)
+        with data._pinned(snapshot.Snapshot.load(store.APP_COLUMNS)):
+            yield bench.YEAR
+
+
+@pytest.mark.parametrize("column", ["catr", "vma"])
+def test_unfiltered_counts_without_cuboid(year, column):
+    assert cube.cuboid_for([column]) is None
+    counts = data.counts([year], [column])
+    expected = schema.read([column], [year]).groupby(column, dropna=False).size()
+    assert counts["count"].sum() == expected.sum()
+    assert sorted(counts["count"]) == sorted(expected)
+
+
+def test_unfiltered_selection_keeps_every_row(year):
+    rows = data.load_dataset([year], ["grav"])
+    assert len(data.filtered_dataset([year], filtering.NO_FILTERS, ["grav"])) == len(rows)
+    assert data.counts([year], ["grav"], filtering.NO_FILTERS)["count"].sum() == len(rows)
+
+
+def test_home_page_follows_the_filters(year):
+    filters = filtering.make({"grav": ["Killed"]})
+    killed = data.load_dataset([year], ["grav"])["grav"].eq("Killed").sum()
+    stats = data.summary([year], filters)
+    assert stats["rows"] == stats["killed"] == killed
+    assert stats["hospitalized"] == 0
+    assert (data.preview([year], 10, filters)["grav"] == "Killed").all()
+
+
+def test_filtered_preview_reads_the_first_selected_rows(year):
+    filters = filtering.make({"grav": ["Killed"]})
+    preview = data.preview([year], 10, filters)
+    rows = data.filtered_dataset([year], filters, list(preview.columns)).head(10)
+    assert len(preview) == min(10, len(rows)) > 0
+    pd.testing.assert_frame_equal(preview.astype(str), rows.reset_index(drop=True).astype(str))
@@ -0,0 +1,30 @@
+"""Department boundaries downloaded by roadsafety.departments."""
+
+import json
+
+import pytest
+
+from roadsafety import departments
+
+PARIS = {"type": "Polygon", "coordinates": [[[2.2, 48.8], [2.4, 48.8], [2.4, 48.9], [2.2, 48.8]]]}
+
+
+def test_fetch_keeps_the_code_and_name(tmp_path, monkeypatch):
+    source = tmp_path / "source.geojson"
+    feature = {"type": "Feature", "geometry": PARIS, "properties": {"code": "75", "nom": "Paris", "extra": 1}}
+    source.write_text(json.dumps({"type": "FeatureCollection", "features": [feature]}))
+    path = tmp_path / "departements.geojson"
+    monkeypatch.setattr(departments, "GEOJSON_PATH", path)
+    assert departments.geojson() is None
+
+    assert departments.fetch_geojson(source.as_uri(), path) == 1
+    assert departments.geojson()["features"][0]["properties"] == {"code": "75", "name": "Paris"}
+
+
+def test_fetch_refuses_departments_without_code(tmp_path):
+    source = tmp_path / "source.geojson"
+    feature = {"type": "Feature", "geometry": PARIS, "properties": {"nom": "Paris"}}
+    source.write_text(json.dumps({"type": "FeatureCollection", "features": [feature]}))
+    with pytest.raises(ValueError):
+        departments.fetch_geojson(source.as_uri(), tmp_path / "departements.geojson")
+    assert not (tmp_path / "departements.geojson").exists()
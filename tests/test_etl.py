@@ -0,0 +1,27 @@
+"""Tables written by roadsafety.etl from a synthetic year of raw files."""
+
+import pandas as pd
+
+from roadsafety import bench, etl, schema, store
+
+
+def test_tables_keep_entities_without_victims(tmp_path):
+    raw = tmp_path / "raw"
+    bench.generate(2000, raw, bench.YEAR)
+    # A vehicle without any user row: the merged rows cannot hold it.
+    users_path = raw / f"usagers-{bench.YEAR}.csv"
+    users = pd.read_csv(users_path, sep=";", dtype=str)
+    orphan = users["id_vehicule"].iloc[0]
+    users[users["id_vehicule"] != orphan].to_csv(users_path, sep=";", index=False)
+
+    tables = tmp_path / "tables"
+    etl.build_year(bench.YEAR, raw, tmp_path / "dataset", report=etl.StageReport(False), tables_dir=tables)
+
+    vehicles = schema.read_table("vehicles", ["id_vehicule"], tables_dir=tables)
+    raw_vehicles = pd.read_csv(raw / f"vehicules-{bench.YEAR}.csv", sep=";", dtype=str)
+    assert orphan in set(vehicles["id_vehicule"])
+    assert len(vehicles) == len(raw_vehicles)
+    kept_users = (users["id_vehicule"] != orphan).sum()
+    assert len(schema.read_table("users", ["id_usager"], tables_dir=tables)) == kept_users
+    dataset = store.open_dataset(dataset_dir=tmp_path / "dataset")
+    assert schema.count_rows([bench.YEAR], "vehicles", dataset, tables) == len(raw_vehicles)
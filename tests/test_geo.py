@@ -0,0 +1,34 @@
+"""Spatial queries of roadsafety.geo.GridIndex against a full scan."""
+
+import numpy as np
+
+from roadsafety import geo
+
+
+def points(rows=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(42, 51, rows)
+    lon = rng.uniform(-5, 8, rows)
+    # Overseas departments, missing and out-of-range coordinates.
+    lat[:3], lon[:3] = [16.25, -21.1, np.nan], [-61.5, 55.5, 2.0]
+    lat[3], lon[3] = 95.0, 2.0
+    return lat, lon
+
+
+def test_viewport_matches_a_scan():
+    lat, lon = points()
+    index = geo.GridIndex(lat, lon)
+    assert len(index) == len(lat) - 2
+    for bbox in [(48.5, 49.2, 1.9, 2.9), (16, 17, -62, -61), (0, 1, 0, 1), (42, 51, -5, 8)]:
+        expected = np.flatnonzero(geo.bbox_mask(lat, lon, bbox))
+        assert np.array_equal(index.viewport(bbox), expected)
+
+
+def test_radius_matches_a_scan():
+    lat, lon = points()
+    index = geo.GridIndex(lat, lon)
+    rows, dist = index.radius(48.85, 2.35, 50)
+    all_dist = geo.haversine_km(lat, lon, 48.85, 2.35)
+    assert set(rows) == set(np.flatnonzero(all_dist <= 50))
+    assert np.allclose(dist, all_dist[rows])
+    assert np.all(np.diff(dist) >= 0)
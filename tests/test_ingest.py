@@ -0,0 +1,31 @@
+"""Incremental ingest of roadsafety.ingest over synthetic years of raw files."""
+
+from roadsafety import bench, cube, ingest, schema, shared, store
+
+
+def test_ingest_only_touches_the_new_year(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw, old, new = tmp_path / "raw", bench.YEAR - 1, bench.YEAR
+    bench.generate(1000, raw, old)
+    bench.generate(1000, raw, new, seed=1)
+    paths = dict(raw_dir=raw, dataset_dir=store.DATASET_DIR, tables_dir=schema.TABLES_DIR,
+                 cube_dir=cube.CUBE_DIR, shared_path=shared.SHARED_PATH, workers=1)
+
+    first, _ = ingest.ingest([old], **paths)
+    shared.build(store.APP_COLUMNS, store.open_dataset(), schema.TABLES_DIR, shared.SHARED_PATH)
+    old_cuboid = cube.cuboid_path("base", old).stat().st_mtime_ns
+    old_table = schema.table_path("users", old).stat().st_mtime_ns
+
+    second, built = ingest.ingest([new], **paths)
+    assert [year for year, _, _ in built] == [new]
+    assert cube.cuboid_path("base", old).stat().st_mtime_ns == old_cuboid
+    assert schema.table_path("users", old).stat().st_mtime_ns == old_table
+    assert second["years"][str(old)] == first["years"][str(old)]
+    assert second["version"] != first["version"]
+    assert ingest.versions() == [first, second]
+
+    dataset = store.open_dataset()
+    mapped = shared.open_shared()
+    assert mapped.version == schema.data_version(dataset)
+    assert sorted(mapped.years) == [old, new]
+    assert len(mapped.column("grav", [new])) == schema.count_rows([new], "victims", dataset)
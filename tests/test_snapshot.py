@@ -0,0 +1,30 @@
+"""Invalidation of the values computed from replaced data versions."""
+
+from roadsafety import cube, snapshot
+
+
+class Versions:
+    """Stand-in for a Snapshot: a version per year."""
+
+    def __init__(self, **versions):
+        self.versions = {int(y[1:]): v for y, v in versions.items()}
+
+    def version_of(self, years):
+        return "+".join(self.versions[y] for y in years)
+
+
+def test_discard_drops_only_the_replaced_years():
+    old, new = Versions(y2023="a", y2024="b"), Versions(y2023="c", y2024="b")
+    cache = snapshot.VersionedCache(8)
+    cache.get(((2023,), "a", "grav"), lambda: "old 2023")
+    cache.get(((2024,), "b", "grav"), lambda: "2024")
+    cache.get(((2023, 2024), "a+b", "grav"), lambda: "old both")
+    assert cache.discard(old, new) == 2
+    assert cache.get(((2024,), "b", "grav"), lambda: "recomputed") == "2024"
+    # A late reader of the replaced version gets its value, which is not kept.
+    assert cache.get(((2023,), "a", "grav"), lambda: "late") == "late"
+    assert len(cache) == 1
+
+
+def test_rebuilt_cube_is_watched():
+    assert cube.CUBE_DIR in snapshot.WATCHED